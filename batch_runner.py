@@ -0,0 +1,135 @@
+import argparse
+import csv
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+RESULT_FIELDS = ["case", "solver", "status", "obj_func", "gap", "run_time", "build_time", "wall_time", "threads", "error"]
+
+
+def list_cases(data_path):
+    # Skip folders without input data, such as the output folder main() writes
+    return sorted(c for c in os.listdir(data_path) if os.path.isfile(os.path.join(data_path, c, "coverage.csv")))
+
+
+def check_results_header(results_path):
+    if not os.path.exists(results_path) or os.path.getsize(results_path) == 0:
+        return
+    with open(results_path, newline="") as f:
+        header = next(csv.reader(f))
+    missing = [field for field in RESULT_FIELDS if field not in header]
+    if len(missing) > 0:
+        raise ValueError("{} is not a batch results file, missing columns {}. Use --results to pick another file"
+                         .format(results_path, missing))
+
+
+def completed_cases(results_path):
+    if not os.path.exists(results_path):
+        return set()
+    with open(results_path, newline="") as f:
+        return {row["case"] for row in csv.DictReader(f) if row.get("status") == "ok"}
+
+
+def append_result(results_path, row):
+    new_file = not os.path.exists(results_path) or os.path.getsize(results_path) == 0
+    fieldnames = RESULT_FIELDS
+    if not new_file:
+        # Keep the column layout of the file being resumed
+        with open(results_path, newline="") as f:
+            fieldnames = next(csv.reader(f))
+    with open(results_path, "a", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction="ignore")
+        if new_file:
+            writer.writeheader()
+        writer.writerow(row)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def run_case(case, folder_path, threads, solver_params, output_dir, build_method="build_model_matrix",
+             use_cache=False, solver="gurobi", trace_path=None):
+    from np_gurobipy_obj import NP_problem
+    from instrumentation import Instrumentation
+
+    start_time = time.time()
+    row = dict(case=case, threads=threads, solver=solver)
+    instrumentation = Instrumentation(case, jsonl_path=trace_path)
+    try:
+        instance = NP_problem(case, folder_path, use_cache=use_cache, instrumentation=instrumentation)
+        instance.solver = solver
+        getattr(instance, build_method)()
+        row["build_time"] = time.time() - start_time
+        instance.solver_params = dict(solver_params, Threads=threads)
+        instance.solve_model()
+        instance.get_df_performance_data()
+        row.update(instance.performance_data, status="ok")
+        instance.gen_solution()
+        instance.save_solution(os.path.join(output_dir, "{}.npz".format(case)))
+    except Exception as e:
+        row.update(status="error", error="{}: {}".format(type(e).__name__, e))
+        traceback.print_exc()
+    row["wall_time"] = time.time() - start_time
+    instrumentation.write_jsonl()
+    return row
+
+
+def run_batch(data_path, results_path=None, output_dir=None, workers=None, total_threads=None, solver_params=None,
+              build_method="build_model_matrix", use_cache=False, solver="gurobi", trace_path=None):
+    if results_path is None:
+        # main() writes results_network_planning.csv with another layout, keep the batch results apart
+        results_path = os.path.join(data_path, "batch_results.csv")
+    if output_dir is None:
+        output_dir = data_path
+    if solver_params is None:
+        solver_params = dict(TimeLimit=6000, MIPGap=0.00)
+    os.makedirs(output_dir, exist_ok=True)
+
+    check_results_header(results_path)
+    done = completed_cases(results_path)
+    pending = [c for c in list_cases(data_path) if c not in done]
+    print("Cases: {} pending, {} already solved".format(len(pending), len(done)))
+    if len(pending) == 0:
+        return
+
+    # Split the available cores across workers so Gurobi threads do not oversubscribe them
+    total_threads = total_threads or os.cpu_count()
+    workers = min(workers or total_threads, len(pending), total_threads)
+    threads = max(1, total_threads // workers)
+    print("Running with {} workers x {} threads".format(workers, threads))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(run_case, case, os.path.join(data_path, case), threads, solver_params,
+                                   output_dir, build_method, use_cache, solver, trace_path): case
+                   for case in pending}
+        for future in as_completed(futures):
+            row = future.result()
+            append_result(results_path, row)
+            print("Case {} finished: {} ({:.1f} s)".format(row["case"], row["status"], row["wall_time"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Solve every case folder in DATA_PATH across a process pool")
+    parser.add_argument("data_path")
+    parser.add_argument("--results", default=None, help="append-only results CSV, default DATA_PATH/batch_results.csv")
+    parser.add_argument("--output-dir", default=None)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--threads", type=int, default=None, help="total Gurobi threads to split across workers")
+    parser.add_argument("--time-limit", type=float, default=6000)
+    parser.add_argument("--mip-gap", type=float, default=0.00)
+    parser.add_argument("--build-method", default="build_model_matrix",
+                        choices=["build_model", "build_model_matrix", "build_model_presolved"])
+    parser.add_argument("--use-cache", action="store_true")
+    parser.add_argument("--solver", default="gurobi", choices=["gurobi", "highs"],
+                        help="highs requires --build-method build_model_matrix or build_model_presolved")
+    parser.add_argument("--trace-file", default=None, help="JSONL file the instrumentation records are appended to")
+    args = parser.parse_args()
+    if args.solver != "gurobi" and args.build_method == "build_model":
+        parser.error("--build-method build_model only supports --solver gurobi")
+    run_batch(args.data_path, args.results, args.output_dir, args.workers, args.threads,
+              dict(TimeLimit=args.time_limit, MIPGap=args.mip_gap), args.build_method, args.use_cache, args.solver,
+              args.trace_file)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from bench_read_data import write_synthetic_case
+from heuristic import greedy_solution
+from instrumentation import DISABLED
+from np_gurobipy_obj import NP_problem, VAR_NAMES
+from solution_export import export_solution, save_solution, load_solution
+
+
+def traced(function):
+    # Timed on a first run, peak memory on a second one, as tracemalloc slows allocations down
+    start_time = time.time()
+    function()
+    elapsed = time.time() - start_time
+    tracemalloc.start()
+    result = function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def solved_problem(folder_path):
+    # Heuristic solution loaded as if it came from the solver: one value per model variable
+    problem = NP_problem("bench", folder_path, instrumentation=DISABLED)
+    problem.build_model_matrix()
+    heuristic = greedy_solution(problem)
+    selected = {name: set(heuristic[category]) for name, category in
+                [("v01NewSite", "new_sites"), ("v01NewNode", "new_nodes"), ("v01NewCell", "new_cells"),
+                 ("v01UpgradeCell", "upgraded_cells")]}
+    values = dict(vFinalCapacity=heuristic["final_capacity"], vTrafficOfCell=heuristic["traffic_of_cell"])
+    problem.solution_values = dict()
+    for name in VAR_NAMES:
+        keys = problem.var_keys(name)
+        if name in selected:
+            problem.solution_values[name] = np.array([k in selected[name] for k in keys], dtype=float)
+        else:
+            problem.solution_values[name] = np.array([values[name].get(k, 0) for k in keys], dtype=float)
+    problem.performance_data = dict(case=problem.name)
+    return problem
+
+
+def legacy_export(problem, output_dir):
+    # Former gen_solution dicts (one entry per variable, zeros included), output_df traffic export and
+    # pickled solution dict
+    problem.solution_from_values()
+    for category, name in [("traffic_of_cell", "vTrafficOfCell"), ("final_capacity", "vFinalCapacity")]:
+        problem.solution[category] = dict(zip(problem.var_keys(name), problem.solution_values[name].tolist()))
+    df = pd.Series(problem.solution["traffic_of_cell"]).reset_index()
+    df.columns = ["site", "node", "cell", "lot", "traffic"]
+    df.to_csv(os.path.join(output_dir, "bench_traffic.csv"))
+    with open(os.path.join(output_dir, "bench.pkl"), 'wb') as handle:
+        pickle.dump(problem.solution, handle, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def new_export(problem, output_dir):
+    # Current gen_solution (values already read from the solver), export_solution and npz solution
+    problem.solution_from_values()
+    export_solution(problem, output_dir)
+    save_solution(os.path.join(output_dir, "bench.npz"), problem)
+
+
+def legacy_load(output_dir):
+    with open(os.path.join(output_dir, "bench.pkl"), 'rb') as handle:
+        return pickle.load(handle)
+
+
+def compare_export(folder_path):
+    problem = solved_problem(folder_path)
+    legacy_dir, new_dir = tempfile.mkdtemp(), tempfile.mkdtemp()
+    try:
+        rows = list()
+        _, t, peak = traced(lambda: legacy_export(problem, legacy_dir))
+        rows.append(("gen_solution + csv + pickle", t, peak, os.path.getsize(os.path.join(legacy_dir, "bench.pkl"))))
+        _, t, peak = traced(lambda: new_export(problem, new_dir))
+        rows.append(("gen_solution + export + npz", t, peak, os.path.getsize(os.path.join(new_dir, "bench.npz"))))
+        _, t, peak = traced(lambda: legacy_load(legacy_dir))
+        rows.append(("load pickle", t, peak, None))
+        _, t, peak = traced(lambda: load_solution(os.path.join(new_dir, "bench.npz")))
+        rows.append(("load npz", t, peak, None))
+    finally:
+        shutil.rmtree(legacy_dir)
+        shutil.rmtree(new_dir)
+
+    print()
+    print("Traffic variables: {}, non-zero: {}".format(len(problem.solution_values["vTrafficOfCell"]),
+                                                        int((problem.solution_values["vTrafficOfCell"] > 0).sum())))
+    print("{:<32}{:>10}{:>14}{:>18}".format("", "time (s)", "peak (MB)", "solution file (B)"))
+    for name, t, peak, size in rows:
+        print("{:<32}{:>10.3f}{:>14.1f}{:>18}".format(name, t, peak / 2 ** 20, "" if size is None else size))
+    return rows
+
+
+if __name__ == "__main__":
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    folder = tempfile.mkdtemp()
+    try:
+        write_synthetic_case(folder, n_rows)
+        compare_export(folder)
+    finally:
+        shutil.rmtree(folder)
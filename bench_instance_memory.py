@@ -0,0 +1,58 @@
+import shutil
+import sys
+import tempfile
+import tracemalloc
+
+from bench_read_data import write_synthetic_case
+from instrumentation import DISABLED
+from read_data import read_data
+from np_instance import NPInstance
+from np_gurobipy_obj import NP_problem
+
+
+def traced_memory(load):
+    tracemalloc.start()
+    data = load()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return data, current, peak
+
+
+def build_problem(**kwargs):
+    # HiGHS keeps its matrix outside the Python heap, so this is what NP_problem and the builder hold
+    problem = NP_problem("bench", instrumentation=DISABLED, **kwargs)
+    problem.solver = "highs"
+    problem.sparse_capacity = True
+    problem.build_model_matrix()
+    return problem
+
+
+def compare_instance_memory(folder_path):
+    _, legacy_current, legacy_peak = traced_memory(lambda: read_data(folder_path))
+    instance, compact_current, compact_peak = traced_memory(lambda: NPInstance.from_folder(folder_path))
+    # What the pipeline holds once the model is built. From an instance nothing is decoded to tuples
+    _, folder_current, folder_peak = traced_memory(lambda: build_problem(input_folder=folder_path))
+    _, problem_current, problem_peak = traced_memory(lambda: build_problem(instance=instance))
+    n_rows = instance.n_coverage
+    print()
+    print("Coverage rows: {}".format(n_rows))
+    print("{:<24}{:>14}{:>14}{:>16}".format("", "retained (B)", "peak (B)", "B/coverage row"))
+    print("{:<24}{:>14}{:>14}{:>16.1f}".format("read_data tuple", legacy_current, legacy_peak,
+                                                legacy_current / n_rows))
+    print("{:<24}{:>14}{:>14}{:>16.1f}".format("NPInstance", compact_current, compact_peak,
+                                                compact_current / n_rows))
+    print("{:<24}{:>14}{:>14}{:>16.1f}".format("folder + build", folder_current, folder_peak,
+                                                folder_current / n_rows))
+    print("{:<24}{:>14}{:>14}{:>16.1f}".format("instance + build", problem_current, problem_peak,
+                                                problem_current / n_rows))
+    print("NPInstance array bytes: {}".format(instance.nbytes()))
+
+
+if __name__ == "__main__":
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    folder = tempfile.mkdtemp()
+    try:
+        write_synthetic_case(folder, n_rows)
+        compare_instance_memory(folder)
+    finally:
+        shutil.rmtree(folder)
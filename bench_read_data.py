@@ -0,0 +1,52 @@
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from generate_instance import generate_case
+from read_data import read_data
+from fast_read_data import read_data_fast, CACHE_DIR
+
+
+def write_synthetic_case(folder_path, n_coverage_rows=100000, n_sites=1500, seed=0):
+    # Four covering sites per lot and node, three nodes
+    return generate_case(folder_path, n_existing_sites=n_sites // 2, n_potential_sites=n_sites - n_sites // 2,
+                         n_lots=max(1, n_coverage_rows // 12), coverage_per_lot_node=4, seed=seed)
+
+
+def _same(a, b):
+    if isinstance(a, dict):
+        return a == b
+    return len(a) == len(b) and set(list(a)) == set(list(b))
+
+
+def compare_read_data(folder_path):
+    shutil.rmtree(os.path.join(folder_path, CACHE_DIR), ignore_errors=True)
+    timings = dict()
+    start_time = time.time()
+    data = read_data(folder_path)
+    timings["read_data"] = time.time() - start_time
+    start_time = time.time()
+    read_data_fast(folder_path)
+    timings["read_data_fast (no cache)"] = time.time() - start_time
+    start_time = time.time()
+    data_fast = read_data_fast(folder_path)
+    timings["read_data_fast (cached)"] = time.time() - start_time
+
+    same = all(_same(a, b) for a, b in zip(data, data_fast))
+    print()
+    for name, t in timings.items():
+        print("{:<28}{:>10.3f} s".format(name, t))
+    print("Same return tuple: {}".format(same))
+    return timings
+
+
+if __name__ == "__main__":
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    folder = tempfile.mkdtemp()
+    try:
+        write_synthetic_case(folder, n_rows)
+        compare_read_data(folder)
+    finally:
+        shutil.rmtree(folder)
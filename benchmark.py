@@ -0,0 +1,160 @@
+import argparse
+import datetime
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+
+from generate_instance import generate_case, SCALES
+from instrumentation import Instrumentation
+
+HISTORY_FILE = "benchmark_history.json"
+# A stage regresses when it is slower (or uses more memory) than the previous run of the same case and
+# configuration by more than the tolerance and the absolute thresholds below
+MIN_TIME_DIFF = 0.05
+MIN_PEAK_DIFF = 1 << 20
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(folder_path, case=None, build_method="build_model_matrix", solver="gurobi", solve=True,
+                  sparse_capacity=False, solver_params=None, trace_memory=True, trace_path=None):
+    # Without solve, the solution is the greedy heuristic one, so IO stages also run without a solver license
+    from np_gurobipy_obj import NP_problem
+    from heuristic import greedy_solution, solution_cost
+
+    case = case or os.path.basename(os.path.normpath(folder_path))
+    instrumentation = Instrumentation(case, trace_memory=trace_memory, verbose=False, jsonl_path=trace_path)
+    output_dir = tempfile.mkdtemp()
+    try:
+        problem = NP_problem(case, folder_path, instrumentation=instrumentation)
+        problem.solver = solver
+        problem.sparse_capacity = sparse_capacity
+        getattr(problem, build_method)()
+        if solve:
+            problem.solver_params = solver_params or dict(MIPGap=0.00)
+            problem.solve_model()
+            problem.get_df_performance_data()
+            problem.gen_solution()
+        else:
+            problem.solution = greedy_solution(problem)
+            problem.performance_data = dict(case=case, obj_func=solution_cost(problem.solution, problem.costs))
+        problem.output_df(output_dir)
+        problem.save_solution(os.path.join(output_dir, "{}.npz".format(case)))
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+        shutil.rmtree(output_dir, ignore_errors=True)
+        instrumentation.write_jsonl()
+
+    stages = dict()
+    for r in instrumentation.spans():
+        stages[r["name"]] = {metric: r[metric] for metric in ["time", "peak"] if metric in r}
+    return dict(
+        case=case,
+        timestamp=datetime.datetime.now().isoformat(timespec="seconds"),
+        commit=_git_commit(),
+        config=dict(build_method=build_method, solver=solver if solve else None, sparse_capacity=sparse_capacity,
+                    trace_memory=trace_memory, python=sys.version.split()[0]),
+        size=dict(lots=len(problem.lots), sites=len(problem.sites), coverage=len(problem.coverage)),
+        counters=dict(instrumentation.counters),
+        obj_func=problem.performance_data["obj_func"],
+        stages=stages,
+    )
+
+
+def load_history(history_path):
+    if not os.path.exists(history_path):
+        return list()
+    with open(history_path) as f:
+        return json.load(f)
+
+
+def find_regressions(record, history, tolerance=0.2):
+    previous = [r for r in history if r["case"] == record["case"] and r["config"] == record["config"]]
+    if len(previous) == 0:
+        return list()
+    baseline = previous[-1]
+    regressions = list()
+    for stage, values in record["stages"].items():
+        if stage not in baseline["stages"]:
+            continue
+        for metric, min_diff in [("time", MIN_TIME_DIFF), ("peak", MIN_PEAK_DIFF)]:
+            new, old = values.get(metric), baseline["stages"][stage].get(metric)
+            if new is None or old is None:
+                continue
+            if new > old * (1 + tolerance) and new - old > min_diff:
+                regressions.append(dict(stage=stage, metric=metric, baseline=old, value=new,
+                                        baseline_commit=baseline["commit"]))
+    return regressions
+
+
+def save_record(history_path, record, history=None):
+    history = load_history(history_path) if history is None else history
+    history.append(record)
+    with open(history_path, "w") as f:
+        json.dump(history, f, indent=1)
+
+
+def print_record(record):
+    print()
+    print("Case {} ({} lots, {} sites, {} coverage rows)".format(record["case"], record["size"]["lots"],
+                                                                  record["size"]["sites"],
+                                                                  record["size"]["coverage"]))
+    print("{:<48}{:>12}{:>14}".format("stage", "time (s)", "peak (MB)"))
+    for stage, values in record["stages"].items():
+        peak = "{:.1f}".format(values["peak"] / 2 ** 20) if "peak" in values else ""
+        print("{:<48}{:>12.3f}{:>14}".format(stage, values["time"], peak))
+    for r in record["regressions"]:
+        print("REGRESSION {} {}: {:.3f} -> {:.3f} (baseline {})".format(r["stage"], r["metric"], r["baseline"],
+                                                                       r["value"], r["baseline_commit"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the read, build, solve and export stages")
+    parser.add_argument("--folder", default=None, help="case folder; a synthetic case is generated if not given")
+    parser.add_argument("--scale", default="small", choices=list(SCALES))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--build-method", default="build_model_matrix",
+                        choices=["build_model", "build_model_matrix", "build_model_presolved"])
+    parser.add_argument("--solver", default="gurobi", choices=["gurobi", "highs"])
+    parser.add_argument("--no-solve", action="store_true", help="skip the solver, export the heuristic solution")
+    parser.add_argument("--sparse-capacity", action="store_true")
+    parser.add_argument("--time-limit", type=float, default=600)
+    parser.add_argument("--no-memory", action="store_true", help="do not trace memory (tracemalloc slows the run)")
+    parser.add_argument("--history", default=HISTORY_FILE)
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--trace-file", default=None, help="JSONL file the span and counter records are appended to")
+    args = parser.parse_args()
+    if args.solver != "gurobi" and args.build_method == "build_model":
+        parser.error("--build-method build_model only supports --solver gurobi")
+
+    folder_path, case = args.folder, None
+    if folder_path is None:
+        case = "{}_{}".format(args.scale, args.seed)
+        folder_path = generate_case(os.path.join(tempfile.mkdtemp(), case), seed=args.seed, **SCALES[args.scale])
+    try:
+        record = run_benchmark(folder_path, case, args.build_method, args.solver, not args.no_solve,
+                               args.sparse_capacity, dict(MIPGap=0.00, TimeLimit=args.time_limit),
+                               not args.no_memory, args.trace_file)
+    finally:
+        if args.folder is None:
+            shutil.rmtree(os.path.dirname(folder_path))
+    history = load_history(args.history)
+    record["regressions"] = find_regressions(record, history, args.tolerance)
+    save_record(args.history, record, history)
+    print_record(record)
+    sys.exit(1 if len(record["regressions"]) > 0 else 0)
+
+
+if __name__ == "__main__":
+    main()
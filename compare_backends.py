@@ -0,0 +1,35 @@
+import sys
+import time
+
+import pandas as pd
+
+from np_gurobipy_obj import NP_problem
+
+
+def compare_backends(cases, solvers=("gurobi", "highs"), solver_params=None, sparse_capacity=True):
+    if solver_params is None:
+        solver_params = dict(MIPGap=0.00, Threads=1, OutputFlag=0)
+    rows = list()
+    for case, folder_path in cases.items():
+        for solver in solvers:
+            instance = NP_problem(case, folder_path)
+            instance.solver = solver
+            instance.sparse_capacity = sparse_capacity
+            instance.build_model_matrix()
+            instance.solver_params = solver_params
+            start_time = time.time()
+            instance.solve_model()
+            solve_wall_time = time.time() - start_time
+            instance.get_df_performance_data()
+            instance.gen_solution()
+            rows.append(dict(instance.performance_data, solver=solver, build_time=instance.build_times["total"],
+                             solve_wall_time=solve_wall_time, feasible=instance.check_solution()))
+    df = pd.DataFrame(rows)
+    print()
+    print(df[["case", "solver", "obj_func", "gap", "build_time", "run_time", "solve_wall_time", "feasible"]]
+          .to_string(index=False))
+    return df
+
+
+if __name__ == "__main__":
+    compare_backends({f: f for f in sys.argv[1:]})
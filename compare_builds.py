@@ -0,0 +1,41 @@
+import sys
+import pandas as pd
+from np_gurobipy_obj import NP_problem
+
+
+def compare_builds(case, folder_path, solve=True, sparse_capacity=False):
+    rows = list()
+    results = dict()
+    for method in ["build_model", "build_model_matrix"]:
+        instance = NP_problem(case, folder_path)
+        instance.sparse_capacity = sparse_capacity
+        getattr(instance, method)()
+        instance.model.update()
+        results[method] = dict(num_vars=instance.model.NumVars,
+                               num_constrs=instance.model.NumConstrs,
+                               obj_func=None)
+        if solve:
+            instance.solver_params = dict(OutputFlag=0, MIPGap=0.00)
+            instance.solve_model()
+            results[method]["obj_func"] = instance.model.ObjVal
+        for family, build_time in instance.build_times.items():
+            rows.append(dict(case=case, method=method, family=family, build_time=build_time))
+
+    df_times = pd.DataFrame(rows).pivot(index="family", columns="method", values="build_time")
+    df_times["speedup"] = df_times["build_model"] / df_times["build_model_matrix"]
+    print(df_times)
+
+    same_counts = results["build_model"]["num_vars"] == results["build_model_matrix"]["num_vars"] and \
+                  results["build_model"]["num_constrs"] == results["build_model_matrix"]["num_constrs"]
+    print("Variables: {} / {}".format(results["build_model"]["num_vars"], results["build_model_matrix"]["num_vars"]))
+    print("Constraints: {} / {}".format(results["build_model"]["num_constrs"], results["build_model_matrix"]["num_constrs"]))
+    if solve:
+        print("Objective: {} / {}".format(results["build_model"]["obj_func"], results["build_model_matrix"]["obj_func"]))
+    if not same_counts:
+        print("ERROR. Build methods produce different models for case {}".format(case))
+    return df_times, results
+
+
+if __name__ == "__main__":
+    for folder_path in sys.argv[1:]:
+        compare_builds(folder_path, folder_path)
@@ -0,0 +1,79 @@
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import pandas as pd
+
+from generate_instance import generate_case, SCALES
+from instrumentation import Instrumentation
+from np_gurobipy_obj import NP_problem
+
+
+def compare_presolve(cases, solver="gurobi", solver_params=None):
+    # Full sparse_capacity model against the presolved one, which has the same optimal objective
+    if solver_params is None:
+        solver_params = dict(MIPGap=0.00, Threads=1, OutputFlag=0)
+    rows = list()
+    for case, folder_path in cases.items():
+        for method in ["build_model_matrix", "build_model_presolved"]:
+            instance = NP_problem(case, folder_path, instrumentation=Instrumentation(case, verbose=False))
+            instance.solver = solver
+            instance.sparse_capacity = True
+            getattr(instance, method)()
+            instance.solver_params = solver_params
+            start_time = time.time()
+            instance.solve_model()
+            solve_wall_time = time.time() - start_time
+            instance.get_df_performance_data()
+            instance.gen_solution()
+            counters = instance.instrumentation.counters
+            rows.append(dict(case=case, method=method,
+                             columns=sum(v for k, v in counters.items() if k.startswith("variables/")),
+                             binaries=counters["variables/binary"],
+                             rows=sum(v for k, v in counters.items() if k.startswith("constraints/")),
+                             obj_func=instance.performance_data["obj_func"], gap=instance.performance_data["gap"],
+                             build_time=instance.build_times["total"],
+                             solve_wall_time=solve_wall_time, feasible=instance.check_solution(),
+                             **{k[len("presolve/"):]: v for k, v in counters.items() if k.startswith("presolve/")}))
+    df = pd.DataFrame(rows)
+    print()
+    columns = ["method", "columns", "binaries", "rows", "obj_func", "gap", "build_time", "solve_wall_time", "feasible"]
+    print(df[["case"] + columns].to_string(index=False))
+    stats = [c for c in df.columns if c not in columns]
+    print()
+    print(df[df["method"] == "build_model_presolved"][stats].to_string(index=False))
+    for case, df_case in df.groupby("case"):
+        # Objectives are only comparable when both models are solved to optimality
+        if (df_case["gap"] < 1e-6).all() and df_case["obj_func"].round(6).nunique() > 1:
+            print("ERROR. Presolved model has a different objective for case {}".format(case))
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the full and the presolved models")
+    parser.add_argument("folders", nargs="*", help="case folders; synthetic cases are generated if not given")
+    parser.add_argument("--scale", default="tiny", choices=list(SCALES))
+    parser.add_argument("--seeds", type=int, default=3)
+    parser.add_argument("--solver", default="gurobi", choices=["gurobi", "highs"])
+    parser.add_argument("--time-limit", type=float, default=600)
+    args = parser.parse_args()
+
+    solver_params = dict(MIPGap=0.00, Threads=1, OutputFlag=0, TimeLimit=args.time_limit)
+    if len(args.folders) > 0:
+        compare_presolve({f: f for f in args.folders}, args.solver, solver_params)
+        return
+    folder = tempfile.mkdtemp()
+    try:
+        cases = dict()
+        for seed in range(args.seeds):
+            case = "{}_{}".format(args.scale, seed)
+            cases[case] = generate_case(os.path.join(folder, case), seed=seed, **SCALES[args.scale])
+        compare_presolve(cases, args.solver, solver_params)
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from scipy.sparse.csgraph import breadth_first_order, connected_components
+
+from hard_coded_data import make_costs
+from heuristic import solution_cost
+from np_instance import NPInstance
+
+
+def _lot_site_graph(instance):
+    n = instance.n_lots + instance.n_sites
+    graph = sp.coo_matrix((np.ones(instance.n_coverage), (instance.cov_lot, instance.n_lots + instance.cov_site)),
+                          shape=(n, n)).tocsr()
+    return graph + graph.T
+
+
+def cluster_lots(instance, max_lots):
+    # Lots are linked through the sites covering them. Connected components of the lot-site coverage
+    # graph are independent; components larger than max_lots are cut along a breadth-first order, so
+    # each cluster stays spatially connected, and small components are packed together.
+    graph = _lot_site_graph(instance)
+    n_components, labels = connected_components(graph, directed=False)
+    order = np.argsort(labels[:instance.n_lots], kind="stable")
+    bounds = np.flatnonzero(np.diff(labels[:instance.n_lots][order])) + 1
+
+    clusters = list()
+    pending = list()
+    for lots in np.split(order, bounds):
+        if len(lots) == 0:
+            continue
+        if len(lots) > max_lots:
+            bfs = breadth_first_order(graph, lots[0], directed=False, return_predecessors=False)
+            bfs = bfs[bfs < instance.n_lots]
+            clusters += [bfs[i:i + max_lots] for i in range(0, len(bfs), max_lots)]
+        elif sum(len(p) for p in pending) + len(lots) > max_lots:
+            clusters.append(np.concatenate(pending))
+            pending = [lots]
+        else:
+            pending.append(lots)
+    if len(pending) > 0:
+        clusters.append(np.concatenate(pending))
+    return clusters
+
+
+def boundary_sites(instance, clusters):
+    # Sites covering lots of more than one cluster
+    cluster_of_lot = np.empty(instance.n_lots, dtype=np.int64)
+    for k, lots in enumerate(clusters):
+        cluster_of_lot[lots] = k
+    pairs = np.unique(np.stack([instance.cov_site, cluster_of_lot[instance.cov_lot]]), axis=1)
+    counts = np.bincount(pairs[0], minlength=instance.n_sites)
+    return set(instance.site_ids[counts > 1].tolist())
+
+
+def solve_cluster(name, instance, solver_params, costs=None):
+    from np_gurobipy_obj import NP_problem
+
+    start_time = time.time()
+    problem = NP_problem(name, instance=instance, costs=costs)
+    problem.sparse_capacity = True
+    problem.build_model_matrix()
+    problem.solver_params = solver_params
+    problem.solve_model()
+    result = dict(name=name, lots=instance.n_lots, status=problem.model.Status, factor=problem.factor,
+                  obj_func=None, bound=problem.model.ObjBound if problem.model.SolCount > 0 else None,
+                  solution=None)
+    if problem.model.SolCount > 0:
+        problem.gen_solution()
+        result.update(obj_func=problem.model.ObjVal, solution=problem.solution)
+    result["wall_time"] = time.time() - start_time
+    return result
+
+
+def _fix_binaries(problem, selected, is_free):
+    for var_dict, keys in [(problem.v01NewSite, selected["new_sites"]), (problem.v01NewNode, selected["new_nodes"]),
+                           (problem.v01NewCell, selected["new_cells"]),
+                           (problem.v01UpgradeCell, selected["upgraded_cells"])]:
+        keys = set(keys)
+        fixed = [(var, 1 if key in keys else 0) for key, var in var_dict.items() if not is_free(key)]
+        if len(fixed) > 0:
+            problem.model.setAttr("LB", [v for v, x in fixed], [x for v, x in fixed])
+            problem.model.setAttr("UB", [v for v, x in fixed], [x for v, x in fixed])
+
+
+def _reserve_cells(problem, reserved, tol=1e-6):
+    # Cells whose reserved traffic is above their initial capacity keep their upgrade or installation,
+    # also when the sub-model has no traffic variable on them
+    data = problem.model_instance()
+    initial = dict(zip(data.cell_keys(data.cap_site, data.cap_node, data.cap_cell), data.initial_capacity.tolist()))
+    for var_dict, base in [(problem.v01UpgradeCell, initial), (problem.v01NewCell, dict())]:
+        needed = [var for key, var in var_dict.items() if reserved.get(key, 0) > base.get(key, 0) + tol]
+        if len(needed) > 0:
+            problem.model.setAttr("LB", needed, [1] * len(needed))
+
+
+def _release_zeros(problem):
+    for var_dict in [problem.v01NewSite, problem.v01NewNode, problem.v01NewCell, problem.v01UpgradeCell]:
+        problem.model.setAttr("UB", list(var_dict.values()), [1] * len(var_dict))
+
+
+def _site(key):
+    return key if not isinstance(key, tuple) else key[0]
+
+
+def site_owners(results, shared_sites):
+    # Each shared site is owned by the cluster routing the most traffic through it
+    carried = dict()
+    for k, r in enumerate(results):
+        for (s, n, c, l), t in r["solution"]["traffic_of_cell"].items():
+            if s in shared_sites and t > 0:
+                carried[s, k] = carried.get((s, k), 0) + t
+    owners = dict()
+    for (s, k), t in carried.items():
+        if s not in owners or t > carried[s, owners[s]]:
+            owners[s] = k
+    return owners
+
+
+def boundary_lots(instance, results, owners, wide=False):
+    # Codes of the lots served in their cluster solution through a shared site owned by another cluster,
+    # or through any shared site if wide
+    lots = set()
+    for k, r in enumerate(results):
+        for (s, n, c, l), t in r["solution"]["traffic_of_cell"].items():
+            if t > 0 and (owners.get(s, k) != k or (wide and s in owners)):
+                lots.add(l)
+    return np.flatnonzero(np.isin(instance.lot_ids, list(lots)))
+
+
+def full_capacity(instance, solution, factor):
+    # Capacity at its upper bound for the installed and upgraded cells, as capacity has no cost. Scaled by
+    # factor like the NP_problem data
+    new_cells, upgraded = set(solution["new_cells"]), set(solution["upgraded_cells"])
+    keys = zip(instance.site_ids[instance.cap_site].tolist(), instance.node_ids[instance.cap_node].tolist(),
+               instance.cell_ids[instance.cap_cell].tolist())
+    capacity = dict()
+    for k, initial, maximum in zip(keys, instance.initial_capacity.tolist(), instance.max_capacity.tolist()):
+        if initial > 0:
+            capacity[k] = (maximum if k in upgraded else initial) * factor
+        else:
+            capacity[k] = maximum * factor if k in new_cells else 0
+    return capacity
+
+
+def coordinate(name, instance, results, shared_sites, solver_params, costs=None, wide_boundary=False):
+    # Fixing-and-resolve on the boundary: decisions of a shared site come from its owning cluster, and the
+    # lots other clusters serve through it are re-solved with their covering sites only (with wide_boundary,
+    # the lots of the owning cluster too). Decisions of the non-shared sites of that sub-model are fixed to
+    # the cluster solutions and the capacity used by the lots that are not re-solved is reserved. The rest
+    # of the solution is kept from the clusters.
+    from np_gurobipy_obj import NP_problem
+
+    owners = site_owners(results, shared_sites)
+    selected = dict(new_sites=set(), new_nodes=set(), new_cells=set(), upgraded_cells=set())
+    traffic = dict()
+    for k, r in enumerate(results):
+        for key in selected:
+            selected[key].update(i for i in r["solution"][key] if _site(i) not in shared_sites or
+                                 owners.get(_site(i)) == k)
+        traffic.update(r["solution"]["traffic_of_cell"])
+
+    lots = boundary_lots(instance, results, owners, wide_boundary)
+    boundary = set(instance.lot_ids[lots].tolist())
+    if len(lots) == 0:
+        solution = {key: list(selected[key]) for key in selected}
+        solution["traffic_of_cell"] = traffic
+        solution["final_capacity"] = full_capacity(instance, solution, results[0]["factor"])
+        return None, solution
+    interior_used = dict()
+    for (s, n, c, l), t in traffic.items():
+        if l not in boundary and t > 0:
+            interior_used[s, n, c] = interior_used.get((s, n, c), 0) + t
+
+    problem = NP_problem("{}_boundary".format(name), instance=instance.subset(lots), costs=costs)
+    problem.sparse_capacity = True
+    problem.build_model_matrix()
+    problem.solver_params = solver_params
+    is_free = lambda key: _site(key) in shared_sites
+    _fix_binaries(problem, selected, is_free)
+    _reserve_cells(problem, interior_used)
+    # Interior cells of the sub-model only have their capacity left over by the interior lots:
+    # traffic - capacity <= -interior traffic
+    keys = [k for k in problem.backend.constrs["MaxTrafficOfCell"].keys() if k in interior_used]
+    problem.backend.set_rhs("MaxTrafficOfCell", keys, [-interior_used[k] for k in keys])
+    problem.solve_model()
+    if problem.model.SolCount == 0:
+        # Capacity next to the boundary is not enough with the interior fixed: let the interior sites of the
+        # boundary sub-model open more, decisions of every other site stay fixed
+        print("Boundary resolve infeasible, releasing the decisions fixed to zero on the boundary sub-model")
+        _release_zeros(problem)
+        problem.solve_model()
+    if problem.model.SolCount == 0:
+        return problem, None
+
+    problem.gen_solution()
+    boundary_sites = set(problem.instance.site_ids.tolist())
+    solution = dict()
+    for key in selected:
+        solution[key] = [k for k in selected[key] if _site(k) not in boundary_sites] + problem.solution[key]
+    solution["traffic_of_cell"] = {k: t for k, t in traffic.items() if k[3] not in boundary}
+    solution["traffic_of_cell"].update(problem.solution["traffic_of_cell"])
+    solution["final_capacity"] = full_capacity(instance, solution, problem.factor)
+    return problem, solution
+
+
+def decompose_and_solve(name, folder_path=None, instance=None, max_lots=500, workers=None, threads=1,
+                        solver_params=None, costs=None, wide_boundary=False):
+    start_time = time.time()
+    if instance is None:
+        instance = NPInstance.from_folder(folder_path)
+    if solver_params is None:
+        solver_params = dict(MIPGap=0.00)
+    clusters = cluster_lots(instance, max_lots)
+    shared_sites = boundary_sites(instance, clusters)
+    print("Lots split in {} clusters. Shared sites: {}".format(len(clusters), len(shared_sites)))
+
+    sub_params = dict(solver_params, Threads=threads)
+    workers = workers or max(1, os.cpu_count() // threads)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(solve_cluster, "{}_{}".format(name, k), instance.subset(lots), sub_params, costs)
+                   for k, lots in enumerate(clusters)]
+        results = [f.result() for f in futures]
+    sub_time = time.time() - start_time
+    failed = [r["name"] for r in results if r["solution"] is None]
+    if len(failed) > 0:
+        raise RuntimeError("Clusters without a feasible solution: {}".format(failed))
+
+    problem, solution = coordinate(name, instance, results, shared_sites,
+                                   dict(solver_params, Threads=threads * workers), costs, wide_boundary)
+
+    # Each cluster model is a relaxation of the full model, so the best cluster bound is a valid bound
+    report = dict(
+        case=name,
+        clusters=len(clusters),
+        shared_sites=len(shared_sites),
+        workers=workers,
+        boundary_lots=0 if problem is None else problem.instance.n_lots,
+        lower_bound=max(r["bound"] for r in results),
+        obj_func=None if solution is None else solution_cost(solution, make_costs(costs)),
+        sub_models_time=sub_time,
+        wall_time=time.time() - start_time,
+    )
+    return report, solution, results
+
+
+def solve_full(name, instance, solver_params, costs=None):
+    from np_gurobipy_obj import NP_problem
+
+    start_time = time.time()
+    problem = NP_problem(name, instance=instance, costs=costs)
+    problem.sparse_capacity = True
+    problem.build_model_matrix()
+    problem.solver_params = solver_params
+    problem.solve_model()
+    return dict(case=name, workers="full", lower_bound=problem.model.ObjBound,
+                obj_func=problem.model.ObjVal if problem.model.SolCount > 0 else None,
+                wall_time=time.time() - start_time)
+
+
+def compare_decomposition(name, folder_path, max_lots=500, core_counts=(1, 2, 4), solve_full_model=True,
+                          solver_params=None, costs=None, wide_boundary=False):
+    if solver_params is None:
+        solver_params = dict(MIPGap=0.00)
+    instance = NPInstance.from_folder(folder_path)
+    rows = list()
+    if solve_full_model:
+        rows.append(solve_full(name, instance, dict(solver_params, Threads=max(core_counts)), costs))
+    for cores in core_counts:
+        report, _, _ = decompose_and_solve(name, instance=instance, max_lots=max_lots, workers=cores, threads=1,
+                                           solver_params=solver_params, costs=costs, wide_boundary=wide_boundary)
+        rows.append(report)
+    df = pd.DataFrame(rows)
+    decomposed = df.workers != "full"
+    df.loc[decomposed, "speedup"] = df.loc[decomposed, "wall_time"].iloc[0] / df.loc[decomposed, "wall_time"]
+    print()
+    print(df[["workers", "clusters", "boundary_lots", "lower_bound", "obj_func", "wall_time", "speedup"]]
+          .to_string(index=False))
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Solve a case by lot-clustering decomposition")
+    parser.add_argument("folder_path")
+    parser.add_argument("--max-lots", type=int, default=500)
+    parser.add_argument("--cores", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--no-full", action="store_true", help="skip the full model")
+    parser.add_argument("--time-limit", type=float, default=6000)
+    parser.add_argument("--wide-boundary", action="store_true",
+                        help="also re-solve the lots the owning cluster serves through shared sites")
+    args = parser.parse_args()
+    compare_decomposition(os.path.basename(os.path.normpath(args.folder_path)), args.folder_path, args.max_lots,
+                          args.cores, not args.no_full, dict(MIPGap=0.00, TimeLimit=args.time_limit),
+                          wide_boundary=args.wide_boundary)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+from instrumentation import DISABLED
+
+CSV_FILES = dict(
+    initial_capacity="capacityi.csv",
+    potential_capacity="capacityp.csv",
+    existing_sites="existing_sites.csv",
+    potential_sites="potential_sites.csv",
+    demand="traffic_demand.csv",
+    coverage="coverage.csv",
+)
+ID_COLUMNS = ["site_id", "node", "cell", "lot_id"]
+CACHE_VERSION = 1
+CACHE_DIR = ".np_cache"
+
+
+def _file_hash(path):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def source_key(folder_path, hash_files=False):
+    key = dict(version=CACHE_VERSION)
+    for table, file_name in CSV_FILES.items():
+        path = os.path.join(folder_path, file_name)
+        st = os.stat(path)
+        key[table] = [st.st_mtime_ns, st.st_size, _file_hash(path) if hash_files else None]
+    return key
+
+
+def _read_csv(path):
+    df = pd.read_csv(path)
+    for col in ID_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+    return df
+
+
+def _write_table(df, path, cache_format):
+    if cache_format == "parquet":
+        df.to_parquet(path, index=False)
+    else:
+        feather.write_feather(df, path, compression="uncompressed")
+
+
+def _load_table(path, cache_format):
+    if cache_format == "parquet":
+        return pq.read_table(path, memory_map=True).to_pandas()
+    return feather.read_table(path, memory_map=True).to_pandas()
+
+
+def read_tables(folder_path, cache_dir=None, cache_format="feather", hash_files=False):
+    if cache_dir is None:
+        cache_dir = os.path.join(folder_path, CACHE_DIR)
+    manifest_path = os.path.join(cache_dir, "manifest.json")
+    key = source_key(folder_path, hash_files)
+
+    manifest = None
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    if manifest is not None and manifest.get("key") == key and manifest.get("format") == cache_format:
+        return {table: _load_table(os.path.join(cache_dir, "{}.{}".format(table, cache_format)), cache_format)
+                for table in CSV_FILES}
+
+    tables = {table: _read_csv(os.path.join(folder_path, file_name)) for table, file_name in CSV_FILES.items()}
+    os.makedirs(cache_dir, exist_ok=True)
+    for table, df in tables.items():
+        _write_table(df, os.path.join(cache_dir, "{}.{}".format(table, cache_format)), cache_format)
+    with open(manifest_path, "w") as f:
+        json.dump(dict(key=key, format=cache_format), f)
+    return tables
+
+
+def _values(series):
+    return np.asarray(series).tolist()
+
+
+def _tuples(df, columns):
+    return list(zip(*[_values(df[col]) for col in columns]))
+
+
+def _group_lists(df, key_columns, value_columns):
+    codes = df.groupby(key_columns, sort=True, observed=True).ngroup().to_numpy()
+    order = np.argsort(codes, kind="stable")
+    bounds = np.flatnonzero(np.diff(codes[order])) + 1
+    starts = np.concatenate([[0], bounds]).astype(np.int64)
+    ends = np.concatenate([bounds, [len(order)]]).astype(np.int64)
+    df_sorted = df.iloc[order]
+    keys = _tuples(df_sorted.iloc[starts], key_columns)
+    if len(value_columns) == 1:
+        values = _values(df_sorted[value_columns[0]])
+    else:
+        values = _tuples(df_sorted, value_columns)
+    return {k: values[a:b] for k, a, b in zip(keys, starts.tolist(), ends.tolist())}
+
+
+def read_data_fast(folder_path, cache_dir=None, cache_format="feather", hash_files=False, instrumentation=DISABLED):
+    with instrumentation.span("tables"):
+        tables = read_tables(folder_path, cache_dir, cache_format, hash_files)
+        instrumentation.count("coverage_rows", len(tables["coverage"]))
+
+    with instrumentation.span("node-site and node-site-cell"):
+        df_initial_capacity = tables["initial_capacity"]
+        existing_sites = _values(tables["existing_sites"].site_id.drop_duplicates())
+        potential_sites = _values(tables["potential_sites"].site_id.drop_duplicates())
+        sites = existing_sites + potential_sites
+        lots = np.asarray(tables["demand"].lot_id.drop_duplicates())
+        nodes = np.asarray(tables["demand"].node.drop_duplicates())
+        cells = np.asarray(tables["coverage"].cell.drop_duplicates())
+
+        cell_columns = ["site_id", "node", "cell"]
+        is_existing = (df_initial_capacity.capacity > 0).to_numpy()
+        df_existing = df_initial_capacity[is_existing]
+        existing_cell_in_site_node = _tuples(df_existing, cell_columns)
+        potential_cell_in_site_node = _tuples(df_initial_capacity[~is_existing], cell_columns)
+        existing_node_in_site = _tuples(df_existing.drop_duplicates(["site_id", "node"]), ["site_id", "node"])
+        site_nodes = pd.MultiIndex.from_product([sites, nodes.tolist()])
+        potential_node_in_site = site_nodes[~site_nodes.isin(existing_node_in_site)].to_list()
+
+    with instrumentation.span("coverage"):
+        initial_capacity = dict(zip(_tuples(df_initial_capacity, cell_columns), _values(df_initial_capacity.capacity)))
+        df_potential_capacity = tables["potential_capacity"]
+        max_capacity = dict(zip(_tuples(df_potential_capacity, cell_columns), _values(df_potential_capacity.capacity)))
+        df_demand = tables["demand"]
+        demand = dict(zip(_tuples(df_demand, ["lot_id", "node"]), _values(df_demand.demand)))
+
+        df_coverage = tables["coverage"]
+        coverage = _tuples(df_coverage.drop_duplicates(ID_COLUMNS), ID_COLUMNS)
+
+    with instrumentation.span("coverage maps"):
+        site_cells_lighting_lot_node = _group_lists(df_coverage, ["lot_id", "node"], ["site_id", "cell"])
+        lots_covered_by_site_node_cell = _group_lists(df_coverage, cell_columns, ["lot_id"])
+
+    return lots, sites, nodes, cells, existing_sites, potential_sites, initial_capacity, max_capacity, demand, \
+           coverage, existing_node_in_site, potential_node_in_site, existing_cell_in_site_node, potential_cell_in_site_node, \
+           site_cells_lighting_lot_node, lots_covered_by_site_node_cell
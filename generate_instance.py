@@ -0,0 +1,100 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+SCALES = dict(
+    tiny=dict(n_existing_sites=4, n_potential_sites=4, n_lots=20, coverage_per_lot_node=3),
+    small=dict(n_existing_sites=30, n_potential_sites=30, n_lots=1000, coverage_per_lot_node=4),
+    medium=dict(n_existing_sites=300, n_potential_sites=300, n_lots=10000, coverage_per_lot_node=4),
+    large=dict(n_existing_sites=1500, n_potential_sites=1500, n_lots=100000, coverage_per_lot_node=4),
+)
+
+
+def generate_case(folder_path, n_existing_sites=30, n_potential_sites=30, nodes=("L800", "L1800", "L2600"),
+                  n_cells=3, n_lots=1000, coverage_per_lot_node=4, existing_node_share=0.7, cell_capacity=2.0,
+                  load=0.3, seed=0):
+    # Writes the six CSV files read by read_data. Sites and lots are placed at random on a unit square;
+    # each lot-node is covered by its coverage_per_lot_node nearest sites, on the sector (cell) of each
+    # site facing the lot. Every site holds every node and cell in capacityi.csv, as in the real cases.
+    rng = np.random.default_rng(seed)
+    os.makedirs(folder_path, exist_ok=True)
+    n_sites = n_existing_sites + n_potential_sites
+    nodes = np.asarray(nodes, dtype=object)
+    n_nodes = len(nodes)
+    sites = np.array(["S{:06d}".format(i) for i in range(n_sites)], dtype=object)
+    lots = np.array(["L{:07d}".format(i) for i in range(n_lots)], dtype=object)
+    cells = np.arange(1, n_cells + 1)
+    site_xy = rng.random((n_sites, 2))
+    lot_xy = rng.random((n_lots, 2))
+
+    # Capacities
+    site_col = np.repeat(np.arange(n_sites), n_nodes * n_cells)
+    node_col = np.tile(np.repeat(np.arange(n_nodes), n_cells), n_sites)
+    cell_col = np.tile(cells, n_sites * n_nodes)
+    existing = (site_col < n_existing_sites) & np.repeat(rng.random(n_sites * n_nodes) < existing_node_share, n_cells)
+    initial_capacity = np.where(existing, rng.uniform(0.25, 0.5, len(site_col)) * cell_capacity, 0)
+    max_capacity = np.where(existing, initial_capacity * 2, cell_capacity)
+    capacity_keys = dict(site_id=sites[site_col], node=nodes[node_col], cell=cell_col)
+    pd.DataFrame(dict(capacity_keys, capacity=initial_capacity)) \
+        .to_csv(os.path.join(folder_path, "capacityi.csv"), index=False)
+    pd.DataFrame(dict(capacity_keys, capacity=max_capacity)) \
+        .to_csv(os.path.join(folder_path, "capacityp.csv"), index=False)
+    pd.DataFrame(dict(site_id=sites[:n_existing_sites])) \
+        .to_csv(os.path.join(folder_path, "existing_sites.csv"), index=False)
+    pd.DataFrame(dict(site_id=sites[n_existing_sites:])) \
+        .to_csv(os.path.join(folder_path, "potential_sites.csv"), index=False)
+
+    # Demand, scaled so that the potential capacity covers it with some slack
+    mean_demand = min(load * n_sites * n_cells * cell_capacity / n_lots, cell_capacity / (2 * coverage_per_lot_node))
+    demand = rng.uniform(0.5, 1.5, n_lots * n_nodes) * mean_demand
+    pd.DataFrame(dict(lot_id=np.repeat(lots, n_nodes), node=np.tile(nodes, n_lots), demand=demand)) \
+        .to_csv(os.path.join(folder_path, "traffic_demand.csv"), index=False)
+
+    # Coverage: nearest sites of each lot, node by node
+    k = min(coverage_per_lot_node + 2, n_sites)
+    _, nearest = cKDTree(site_xy).query(lot_xy, k=k)
+    nearest = nearest.reshape(n_lots, k)
+    cov_site, cov_lot, cov_node = list(), list(), list()
+    for n in range(n_nodes):
+        # A random subset of the nearest sites serves each node, so nodes do not share the exact same cells
+        pick = np.argsort(rng.random((n_lots, k)), axis=1)[:, :min(coverage_per_lot_node, k)]
+        chosen = np.take_along_axis(nearest, pick, axis=1)
+        cov_site.append(chosen.ravel())
+        cov_lot.append(np.repeat(np.arange(n_lots), chosen.shape[1]))
+        cov_node.append(np.full(chosen.size, n))
+    cov_site, cov_lot, cov_node = np.concatenate(cov_site), np.concatenate(cov_lot), np.concatenate(cov_node)
+
+    # Every (site, node, cell) lights at least its nearest lot
+    _, nearest_lot = cKDTree(lot_xy).query(site_xy, k=1)
+    cov_site = np.concatenate([cov_site, site_col])
+    cov_lot = np.concatenate([cov_lot, np.asarray(nearest_lot)[site_col]])
+    cov_node = np.concatenate([cov_node, node_col])
+    angle = np.arctan2(*(lot_xy[cov_lot] - site_xy[cov_site]).T[::-1])
+    cov_cell = (((angle + np.pi) / (2 * np.pi) * n_cells).astype(np.int64) % n_cells) + 1
+    cov_cell[-len(site_col):] = cell_col
+    df_coverage = pd.DataFrame(dict(site_id=sites[cov_site], node=nodes[cov_node], cell=cov_cell, lot_id=lots[cov_lot]))
+    df_coverage.drop_duplicates().to_csv(os.path.join(folder_path, "coverage.csv"), index=False)
+    return folder_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic network planning case")
+    parser.add_argument("folder_path")
+    parser.add_argument("--scale", default="small", choices=list(SCALES))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--lots", type=int, default=None)
+    parser.add_argument("--coverage", type=int, default=None, help="covering sites per lot and node")
+    args = parser.parse_args()
+    config = dict(SCALES[args.scale])
+    if args.lots is not None:
+        config["n_lots"] = args.lots
+    if args.coverage is not None:
+        config["coverage_per_lot_node"] = args.coverage
+    generate_case(args.folder_path, seed=args.seed, **config)
+
+
+if __name__ == "__main__":
+    main()
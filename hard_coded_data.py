@@ -3,4 +3,33 @@ pCAPEX_NEW_CELL = 11737
 pCAPEX_NEW_SITE = 28855
 pCAPEX_NEW_NODE = 36770
 pOPEX_SITE = 1960
-pOPEX_NODE = 0
\ No newline at end of file
+pOPEX_NODE = 0
+
+# Default cost parameters. Every NP_problem keeps its own copy in NP_problem.costs
+COSTS = dict(
+    pCAPEX_UPGRADE_CEll=pCAPEX_UPGRADE_CEll,
+    pCAPEX_NEW_CELL=pCAPEX_NEW_CELL,
+    pCAPEX_NEW_SITE=pCAPEX_NEW_SITE,
+    pCAPEX_NEW_NODE=pCAPEX_NEW_NODE,
+    pOPEX_SITE=pOPEX_SITE,
+    pOPEX_NODE=pOPEX_NODE,
+)
+
+
+def make_costs(costs=None, base=None):
+    # Copy of base (COSTS by default) with the given parameters changed
+    costs = dict() if costs is None else costs
+    unknown = [k for k in costs.keys() if k not in COSTS]
+    if len(unknown) > 0:
+        raise ValueError("Unknown cost parameters {}. Available: {}".format(unknown, list(COSTS)))
+    return dict(COSTS if base is None else base, **costs)
+
+
+def variable_costs(costs):
+    # Objective coefficient of each binary variable of the model
+    return dict(
+        v01NewSite=costs["pCAPEX_NEW_SITE"] + costs["pOPEX_SITE"],
+        v01NewNode=costs["pCAPEX_NEW_NODE"] + costs["pOPEX_NODE"],
+        v01NewCell=costs["pCAPEX_NEW_CELL"],
+        v01UpgradeCell=costs["pCAPEX_UPGRADE_CEll"],
+    )
@@ -0,0 +1,384 @@
+import heapq
+import sys
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.optimize import linprog
+
+from hard_coded_data import *
+
+EPS = 1e-6
+
+
+class GreedyPlanner:
+    # Greedy/repair heuristic over the NP_problem data. Existing capacity is used first, then cell groups
+    # are upgraded and finally new cells (with their node and site) are opened, always picking the
+    # (site, node) group with the lowest cost per unit of uncovered lot demand it can serve. Whenever demand
+    # is left unmet after a phase, traffic is rerouted with a transport LP and, if still needed at the end,
+    # the groups used by the LP relaxation are opened, so the result is feasible whenever the instance is.
+    # A final drop pass closes the opened or upgraded groups the routing does not need.
+    def __init__(self, problem):
+        self.problem = problem
+        self.costs = variable_costs(problem.costs)
+        self.capacity = dict()
+        self.used = dict()
+        self.traffic = dict()
+        self.uncovered = {i: d for i, d in problem.demand.items() if d > EPS}
+        self.new_sites = set()
+        self.new_nodes = set()
+        self.new_cells = list()
+        self.upgraded_cells = list()
+        self.opened_groups = set()
+        self.upgraded_groups = set()
+        for i in problem.existing_cell_in_site_node:
+            self.capacity[i] = problem.initial_capacity[i]
+
+    def _assign(self, s, n, c, l, free):
+        need = self.uncovered.get((l, n), 0)
+        if need <= EPS or free <= EPS:
+            return free
+        t = min(need, free)
+        self.traffic[s, n, c, l] = self.traffic.get((s, n, c, l), 0) + t
+        if need - t > EPS:
+            self.uncovered[l, n] = need - t
+        else:
+            del self.uncovered[l, n]
+        self.used[s, n, c] = self.used.get((s, n, c), 0) + t
+        return free - t
+
+    def _free(self, i):
+        return self.capacity.get(i, 0) - self.used.get(i, 0)
+
+    def route_lots(self):
+        # Lot-nodes with fewer serving cells are routed first
+        lot_nodes = sorted(self.uncovered, key=lambda i: len(self.problem.site_cells_lighting_lot_node.get(i, ())))
+        for (l, n) in lot_nodes:
+            for (s, c) in self.problem.site_cells_lighting_lot_node.get((l, n), ()):
+                self._assign(s, n, c, l, self._free((s, n, c)))
+                if (l, n) not in self.uncovered:
+                    break
+
+    def route_cells(self, cells):
+        for (s, n, c) in cells:
+            free = self._free((s, n, c))
+            for l in self.problem.lots_covered_by_site_node_cell.get((s, n, c), ()):
+                free = self._assign(s, n, c, l, free)
+                if free <= EPS:
+                    break
+
+    def _upgrade_action(self, s, n):
+        cells = [(s, n, c) for c in self.problem.existing_cells_by_site_node[s, n]]
+        added = [self.problem.max_capacity[i] - self.problem.initial_capacity[i] for i in cells]
+        return cells, added, self.costs["v01UpgradeCell"] * len(cells)
+
+    def _open_action(self, s, n):
+        cells = [(s, n, c) for c in self.problem.potential_cells_by_site_node[s, n]]
+        added = [self.problem.max_capacity[i] for i in cells]
+        cost = self.costs["v01NewCell"] * len(cells)
+        if (s, n) in self.problem.potential_node_in_site_set and (s, n) not in self.new_nodes:
+            cost += self.costs["v01NewNode"]
+        if s in self.problem.potential_sites_set and s not in self.new_sites:
+            cost += self.costs["v01NewSite"]
+        return cells, added, cost
+
+    def _ratio(self, action, s, n):
+        cells, added, cost = action(s, n)
+        lots = set()
+        for i in cells:
+            lots.update(self.problem.lots_covered_by_site_node_cell.get(i, ()))
+        gain = min(sum(added), sum(self.uncovered.get((l, n), 0) for l in lots))
+        if gain <= EPS:
+            return None
+        return cost / gain
+
+    def _greedy_phase(self, action, groups, apply):
+        heap = list()
+        for k, (s, n) in enumerate(groups):
+            ratio = self._ratio(action, s, n)
+            if ratio is not None:
+                heap.append((ratio, k, s, n))
+        heapq.heapify(heap)
+        # Lazy evaluation: the popped ratio is recomputed and only applied if it still beats the next one
+        while len(heap) > 0 and len(self.uncovered) > 0:
+            _, k, s, n = heapq.heappop(heap)
+            ratio = self._ratio(action, s, n)
+            if ratio is None:
+                continue
+            if len(heap) > 0 and ratio > heap[0][0]:
+                heapq.heappush(heap, (ratio, k, s, n))
+                continue
+            cells, added, _ = action(s, n)
+            apply(s, n, cells)
+            self.route_cells(cells)
+
+    def _apply_upgrade(self, s, n, cells):
+        self.upgraded_groups.add((s, n))
+        for i in cells:
+            self.capacity[i] = self.problem.max_capacity[i]
+            self.upgraded_cells.append(i)
+
+    def _apply_open(self, s, n, cells):
+        self.opened_groups.add((s, n))
+        for i in cells:
+            self.capacity[i] = self.problem.max_capacity[i]
+            self.new_cells.append(i)
+        if (s, n) in self.problem.potential_node_in_site_set:
+            self.new_nodes.add((s, n))
+        if s in self.problem.potential_sites_set:
+            self.new_sites.add(s)
+
+    def _close_upgrade(self, s, n, cells):
+        self.upgraded_groups.discard((s, n))
+        closed = set(cells)
+        for i in cells:
+            self.capacity[i] = self.problem.initial_capacity[i]
+        self.upgraded_cells = [i for i in self.upgraded_cells if i not in closed]
+
+    def _close_open(self, s, n, cells):
+        self.opened_groups.discard((s, n))
+        closed = set(cells)
+        for i in cells:
+            self.capacity.pop(i, None)
+        self.new_cells = [i for i in self.new_cells if i not in closed]
+        self.new_nodes.discard((s, n))
+        if not any(g[0] == s for g in self.opened_groups):
+            self.new_sites.discard(s)
+
+    def _bought_groups(self):
+        # Opened or upgraded groups with their cells, the capacity they had before and their cost
+        costs, p = self.costs, self.problem
+        groups = list()
+        for (s, n) in self.upgraded_groups:
+            cells = [(s, n, c) for c in p.existing_cells_by_site_node[s, n]]
+            groups.append((costs["v01UpgradeCell"] * len(cells), "upgrade", s, n, cells,
+                           [p.initial_capacity[i] for i in cells]))
+        for (s, n) in self.opened_groups:
+            cells = [(s, n, c) for c in p.potential_cells_by_site_node[s, n]]
+            cost = costs["v01NewCell"] * len(cells)
+            if (s, n) in p.potential_node_in_site_set:
+                cost += costs["v01NewNode"]
+            if s in p.potential_sites_set:
+                cost += costs["v01NewSite"]
+            groups.append((cost, "open", s, n, cells, [0] * len(cells)))
+        groups.sort(key=lambda g: -g[0])
+        return groups
+
+    def _demanded_coverage(self, cells):
+        # Coverage rows of the given cells towards lot-nodes with demand, and the index of those lot-nodes
+        demand = self.problem.demand
+        rows = [k for k in self.problem.coverage if k[:3] in cells and demand.get((k[3], k[1]), 0) > EPS]
+        lot_nodes = {i: r for r, i in enumerate(i for i, d in demand.items() if d > EPS)}
+        return rows, lot_nodes
+
+    def _transport_matrices(self, rows, lot_nodes, cells):
+        # Demand rows (one per lot-node) and capacity rows (one per cell) over the traffic of the coverage rows
+        cols = np.arange(len(rows))
+        A_demand = sp.csr_matrix((np.ones(len(rows)), ([lot_nodes[(l, n)] for (s, n, c, l) in rows], cols)),
+                                 shape=(len(lot_nodes), len(rows)))
+        A_cells = sp.csr_matrix((np.ones(len(rows)), ([cells[k[:3]] for k in rows], cols)),
+                                shape=(len(cells), len(rows)))
+        return A_demand, A_cells
+
+    def _set_traffic(self, rows, values):
+        self.traffic = dict()
+        self.used = dict()
+        for k, t in zip(rows, values):
+            if t > EPS:
+                self.traffic[k] = t
+                self.used[k[:3]] = self.used.get(k[:3], 0) + t
+
+    def reroute(self):
+        # Repair: transport LP over the capacity opened so far. Greedy routing never moves traffic once
+        # assigned, so lots only covered by a full cell may be left unmet while other routings exist
+        if len(self.capacity) == 0:
+            return
+        demand = self.problem.demand
+        cells = {i: r for r, i in enumerate(i for i, cap in self.capacity.items() if cap > EPS)}
+        rows, lot_nodes = self._demanded_coverage(cells)
+        A_demand, A_cells = self._transport_matrices(rows, lot_nodes, cells)
+        # Unmet demand of every lot-node is a slack variable, which is minimized
+        n_x, n_slack = len(rows), len(lot_nodes)
+        result = linprog(np.concatenate([np.zeros(n_x), np.ones(n_slack)]),
+                         A_ub=sp.hstack([A_cells, sp.csr_matrix((len(cells), n_slack))]),
+                         b_ub=[self.capacity[i] for i in cells],
+                         A_eq=sp.hstack([A_demand, sp.identity(n_slack)]),
+                         b_eq=[demand[i] for i in lot_nodes], bounds=(0, None), method="highs")
+        self._set_traffic(rows, result.x[:n_x])
+        self.uncovered = {i: slack for i, slack in zip(lot_nodes, result.x[n_x:])
+                          if slack > EPS * max(1, demand[i])}
+
+    def route_by_cost(self, weights):
+        # Transport LP meeting all demand that keeps traffic off the cells with a high weight
+        demand = self.problem.demand
+        cells = {i: r for r, i in enumerate(i for i, cap in self.capacity.items() if cap > EPS)}
+        rows, lot_nodes = self._demanded_coverage(cells)
+        A_demand, A_cells = self._transport_matrices(rows, lot_nodes, cells)
+        result = linprog([weights.get(k[:3], 0) for k in rows], A_ub=A_cells, b_ub=[self.capacity[i] for i in cells],
+                         A_eq=A_demand, b_eq=[demand[i] for i in lot_nodes], bounds=(0, None), method="highs")
+        if result.status != 0:
+            return False
+        self._set_traffic(rows, result.x)
+        return True
+
+    def _reroute_lots(self, lot_nodes, capacity):
+        # Transport LP moving all traffic of the given lot-nodes within the capacity left by the other lots
+        p = self.problem
+        lot_rows = {i: r for r, i in enumerate(lot_nodes)}
+        rows = [(s, n, c, l) for (l, n) in lot_nodes for (s, c) in p.site_cells_lighting_lot_node.get((l, n), ())
+                if capacity.get((s, n, c), 0) > EPS]
+        if len(rows) == 0:
+            return (rows, []) if len(lot_nodes) == 0 else None
+        cells = {i: r for r, i in enumerate(set(k[:3] for k in rows))}
+        A_demand, A_cells = self._transport_matrices(rows, lot_rows, cells)
+        free = dict()
+        for i in cells:
+            free[i] = capacity[i] - self.used.get(i, 0)
+        for k, t in self.traffic.items():
+            if (k[3], k[1]) in lot_rows and k[:3] in free:
+                free[k[:3]] += t
+        result = linprog(np.zeros(len(rows)), A_ub=A_cells, b_ub=[max(free[i], 0) for i in cells],
+                         A_eq=A_demand, b_eq=[p.demand[i] for i in lot_nodes], bounds=(0, None), method="highs")
+        if result.status != 0:
+            return None
+        return rows, result.x
+
+    def drop_groups(self, max_rounds=20):
+        # Cleanup by slope scaling: traffic is routed with every opened or upgraded group priced at its cost
+        # per unit of traffic it carried in the previous round, and groups left without traffic above their
+        # previous capacity are closed, until the routing settles
+        groups = self._bought_groups()
+        carried = {(kind, s, n): sum(self.problem.max_capacity[i] - b for i, b in zip(cells, base))
+                   for _, kind, s, n, cells, base in groups}
+        for _ in range(max_rounds):
+            weights = dict()
+            for cost, kind, s, n, cells, _ in groups:
+                for i in cells:
+                    weights[i] = cost / max(carried[kind, s, n], EPS)
+            if not self.route_by_cost(weights):
+                return
+            kept = list()
+            previous = dict(carried)
+            for group in groups:
+                _, kind, s, n, cells, base = group
+                carried[kind, s, n] = sum(max(self.used.get(i, 0) - b, 0) for i, b in zip(cells, base))
+                if carried[kind, s, n] <= EPS:
+                    close = self._close_upgrade if kind == "upgrade" else self._close_open
+                    close(s, n, cells)
+                else:
+                    kept.append(group)
+            if len(kept) == len(groups) and all(abs(carried[k] - previous[k]) <= EPS * max(1, previous[k])
+                                                for k in carried):
+                break
+            groups = kept
+
+        # Then the most expensive groups first, a group is closed if the lots it serves fit elsewhere
+        lots_of_cell = dict()
+        for (s, n, c, l), t in self.traffic.items():
+            lots_of_cell.setdefault((s, n, c), set()).add((l, n))
+        for _, kind, s, n, cells, base in groups:
+            lot_nodes = sorted(set().union(*[lots_of_cell.get(i, set()) for i in cells]))
+            capacity = dict(self.capacity)
+            capacity.update(zip(cells, base))
+            rerouted = self._reroute_lots(lot_nodes, capacity)
+            if rerouted is None:
+                continue
+            close = self._close_upgrade if kind == "upgrade" else self._close_open
+            close(s, n, cells)
+            moved = set(lot_nodes)
+            for k in [k for k in self.traffic if (k[3], k[1]) in moved]:
+                t = self.traffic.pop(k)
+                self.used[k[:3]] -= t
+                lots_of_cell[k[:3]].discard((k[3], k[1]))
+            for k, t in zip(*rerouted):
+                if t > EPS:
+                    self.traffic[k] = t
+                    self.used[k[:3]] = self.used.get(k[:3], 0) + t
+                    lots_of_cell.setdefault(k[:3], set()).add((k[3], k[1]))
+
+    def open_lp_groups(self):
+        # Repair: LP relaxation over the groups not opened yet, every group it uses is opened
+        p = self.problem
+        groups = [("upgrade", g) for g in p.existing_cells_by_site_node if g not in self.upgraded_groups] + \
+                 [("open", g) for g in p.potential_cells_by_site_node if g not in self.opened_groups]
+        cells = {i: r for r, i in enumerate(list(p.existing_cell_in_site_node) + list(p.potential_cell_in_site_node))}
+        rows, lot_nodes = self._demanded_coverage(cells)
+        A_demand, A_cells = self._transport_matrices(rows, lot_nodes, cells)
+        # Capacity of a cell is its current one plus the extra capacity of its group times the group variable
+        group_rows, group_cols, extra, cost = list(), list(), list(), list()
+        for j, (kind, (s, n)) in enumerate(groups):
+            action = self._upgrade_action if kind == "upgrade" else self._open_action
+            group_cells, added, group_cost = action(s, n)
+            cost.append(group_cost)
+            for i, a in zip(group_cells, added):
+                group_rows.append(cells[i])
+                group_cols.append(j)
+                extra.append(-max(a, 0))
+        A_groups = sp.csr_matrix((extra, (group_rows, group_cols)), shape=(len(cells), len(groups)))
+        n_x = len(rows)
+        result = linprog(np.concatenate([np.zeros(n_x), cost]),
+                         A_ub=sp.hstack([A_cells, A_groups]), b_ub=[self.capacity.get(i, 0) for i in cells],
+                         A_eq=sp.hstack([A_demand, sp.csr_matrix((len(lot_nodes), len(groups)))]),
+                         b_eq=[p.demand[i] for i in lot_nodes],
+                         bounds=[(0, None)] * n_x + [(0, 1)] * len(groups), method="highs")
+        if result.status != 0:
+            return False
+        for (kind, (s, n)), y in zip(groups, result.x[n_x:]):
+            if y > EPS:
+                action, apply = (self._upgrade_action, self._apply_upgrade) if kind == "upgrade" else \
+                    (self._open_action, self._apply_open)
+                apply(s, n, action(s, n)[0])
+        return True
+
+    def solve(self):
+        self.route_lots()
+        if len(self.uncovered) > 0:
+            self.reroute()
+        self._greedy_phase(self._upgrade_action, list(self.problem.existing_cells_by_site_node.keys()),
+                           self._apply_upgrade)
+        if len(self.uncovered) > 0:
+            self.reroute()
+        self._greedy_phase(self._open_action, list(self.problem.potential_cells_by_site_node.keys()),
+                           self._apply_open)
+        if len(self.uncovered) > 0:
+            self.reroute()
+        if len(self.uncovered) > 0 and self.open_lp_groups():
+            self.reroute()
+        if len(self.uncovered) > 0:
+            print("WARNING. Heuristic left {} lot-node pairs with unmet demand".format(len(self.uncovered)))
+        else:
+            self.drop_groups()
+        return self.solution()
+
+    def solution(self):
+        problem = self.problem
+        return dict(
+            new_sites=[s for s in problem.potential_sites if s in self.new_sites],
+            new_nodes=[i for i in problem.potential_node_in_site if i in self.new_nodes],
+            new_cells=self.new_cells,
+            upgraded_cells=self.upgraded_cells,
+            traffic_of_cell={i: self.traffic.get(i, 0) for i in problem.coverage},
+            final_capacity={i: self.capacity.get(i, 0) for i in problem.capacity_keys()},
+        )
+
+
+def greedy_solution(problem):
+    with problem.instrumentation.span("heuristic"):
+        solution = GreedyPlanner(problem).solve()
+    print("Heuristic solution cost: {}".format(solution_cost(solution, problem.costs)))
+    return solution
+
+
+def solution_cost(solution, costs=COSTS):
+    costs = variable_costs(costs)
+    return len(solution["new_sites"]) * costs["v01NewSite"] + \
+           len(solution["new_nodes"]) * costs["v01NewNode"] + \
+           len(solution["new_cells"]) * costs["v01NewCell"] + \
+           len(solution["upgraded_cells"]) * costs["v01UpgradeCell"]
+
+
+if __name__ == "__main__":
+    from np_gurobipy_obj import NP_problem
+
+    instance = NP_problem(sys.argv[1], sys.argv[1])
+    instance.solution = greedy_solution(instance)
+    instance.check_solution()
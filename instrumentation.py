@@ -0,0 +1,171 @@
+import json
+import time
+import tracemalloc
+
+
+class Span:
+    def __init__(self, instrumentation, name, attrs):
+        self.instrumentation = instrumentation
+        self.name = name
+        self.attrs = attrs
+
+    @property
+    def path(self):
+        return self.name if self.parent is None else self.parent.path + "/" + self.name
+
+    def rename(self, name):
+        # For spans whose name is only known once their work is done
+        self.name = name
+
+    def __enter__(self):
+        instr = self.instrumentation
+        self.parent = instr.stack[-1] if len(instr.stack) > 0 else None
+        self.peak = 0
+        if instr.trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            # The peak counter is reset for this span, so the enclosing spans keep what they reached so far
+            for parent in instr.stack:
+                parent.peak = max(parent.peak, peak)
+            tracemalloc.reset_peak()
+            self.start_memory = current
+        instr.stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        elapsed = time.perf_counter() - self.start
+        instr = self.instrumentation
+        instr.stack.pop()
+        record = dict(type="span", name=self.path, start=self.start - instr.t0, time=elapsed, **self.attrs)
+        if instr.trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            self.peak = max(self.peak, peak)
+            for parent in instr.stack:
+                parent.peak = max(parent.peak, self.peak)
+            record.update(memory=current - self.start_memory, peak=self.peak - self.start_memory)
+        if exc_type is not None:
+            record["error"] = exc_type.__name__
+        instr.records.append(record)
+        if instr.verbose:
+            print("{}: {}".format(self.path, elapsed))
+        return False
+
+
+class Instrumentation:
+    # Named spans (wall time and, with trace_memory, tracemalloc deltas) and counters, kept in
+    # memory as a list of records and appended to a JSONL file by write_jsonl
+    enabled = True
+
+    def __init__(self, name=None, trace_memory=False, verbose=True, jsonl_path=None):
+        self.name = name
+        self.trace_memory = trace_memory
+        self.verbose = verbose
+        self.jsonl_path = jsonl_path
+        self.records = list()
+        self.counters = dict()
+        self.stack = list()
+        self.t0 = time.perf_counter()
+        self._written = 0
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def span(self, name, **attrs):
+        return Span(self, name, attrs)
+
+    def count(self, name, value):
+        self.counters[name] = value
+        span = self.stack[-1].path if len(self.stack) > 0 else None
+        self.records.append(dict(type="counter", name=name, value=value, span=span))
+
+    def event(self, name, **fields):
+        self.records.append(dict(type="event", name=name, at=time.perf_counter() - self.t0, **fields))
+
+    def spans(self):
+        return [r for r in self.records if r["type"] == "span"]
+
+    def times(self, name):
+        # Time of the last span with the given name and of its direct children, {child: time, "total": time}
+        spans = self.spans()
+        last = [r for r in spans if r["name"] == name]
+        if len(last) == 0:
+            return dict()
+        last = last[-1]
+        prefix = name + "/"
+        times = {r["name"][len(prefix):]: r["time"] for r in spans
+                 if r["name"].startswith(prefix) and "/" not in r["name"][len(prefix):] and r["start"] >= last["start"]}
+        times["total"] = last["time"]
+        return times
+
+    def gurobi_callback(self, callback=None):
+        # Records incumbent and bound each time one of them changes, then calls the given callback
+        from gurobipy import GRB
+
+        last = [None]
+
+        def record_progress(model, where):
+            if where == GRB.Callback.MIP:
+                progress = (model.cbGet(GRB.Callback.MIP_OBJBST), model.cbGet(GRB.Callback.MIP_OBJBND))
+                if progress != last[0]:
+                    last[0] = progress
+                    self.event("solver_progress", runtime=model.cbGet(GRB.Callback.RUNTIME),
+                               incumbent=progress[0], bound=progress[1],
+                               nodes=model.cbGet(GRB.Callback.MIP_NODCNT))
+            if callback is not None:
+                callback(model, where)
+
+        return record_progress
+
+    def write_jsonl(self, path=None):
+        # Appends the records not written yet, in a single write so that processes can share the file
+        path = path or self.jsonl_path
+        if path is None:
+            return
+        lines = "".join(json.dumps(dict(r, case=self.name)) + "\n" for r in self.records[self._written:])
+        with open(path, "a") as f:
+            f.write(lines)
+        self._written = len(self.records)
+
+
+class NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        return False
+
+    def rename(self, name):
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+class NullInstrumentation:
+    enabled = False
+    name = None
+    records = ()
+    counters = dict()
+
+    def span(self, name, **attrs):
+        return NULL_SPAN
+
+    def count(self, name, value):
+        pass
+
+    def event(self, name, **fields):
+        pass
+
+    def spans(self):
+        return list()
+
+    def times(self, name):
+        return dict()
+
+    def gurobi_callback(self, callback=None):
+        return callback
+
+    def write_jsonl(self, path=None):
+        pass
+
+
+DISABLED = NullInstrumentation()
@@ -0,0 +1,256 @@
+import numpy as np
+import scipy.sparse as sp
+
+from hard_coded_data import *
+from np_instance import CodedKeys
+
+# Mirror GRB.BINARY, GRB.CONTINUOUS, GRB.LESS_EQUAL, GRB.GREATER_EQUAL and GRB.EQUAL
+BINARY = "B"
+CONTINUOUS = "C"
+LESS_EQUAL = "<"
+GREATER_EQUAL = ">"
+EQUAL = "="
+
+
+def _positions(selected, n):
+    # Position of every code in selected, -1 for the codes not in it
+    positions = np.full(n, -1, dtype=np.int64)
+    positions[selected] = np.arange(len(selected))
+    return positions
+
+
+class ModelIndex:
+    # Contiguous integer index for every entity of the model, over the code arrays of an NPInstance in
+    # model units (see NP_problem.model_instance). Cells are site-node-cell codes and lot-nodes lot-node codes
+    def __init__(self, data, sparse_capacity):
+        self.data = data
+        n_pairs = data.n_sites * data.n_nodes
+        n_cells = n_pairs * data.n_cells
+        existing = data.cap_is_existing
+        cap_cells = data.cell_code(data.cap_site, data.cap_node, data.cap_cell)
+
+        self.potential_sites = np.arange(data.n_existing_sites, data.n_sites)
+        # Node of a site is potential unless an existing cell is installed on it
+        existing_pairs = np.zeros(n_pairs, dtype=bool)
+        existing_pairs[data.cap_site[existing].astype(np.int64) * data.n_nodes + data.cap_node[existing]] = True
+        self.potential_nodes = np.flatnonzero(~existing_pairs)
+        # Rows of the capacity arrays
+        self.existing_cells = np.flatnonzero(existing)
+        self.potential_cells = np.flatnonzero(~existing)
+        if sparse_capacity:
+            self.capacity = np.concatenate([cap_cells[self.existing_cells], cap_cells[self.potential_cells]])
+        else:
+            self.capacity = np.arange(n_cells)
+        self.cap_cells = cap_cells
+        self.cell_position = _positions(self.capacity, n_cells)
+        self.node_position = _positions(self.potential_nodes, n_pairs)
+        self.n_coverage = data.n_coverage
+        self.n_lot_nodes = data.n_lots * data.n_nodes
+        self.cov_cells = data.cell_code(data.cov_site, data.cov_node, data.cov_cell)
+        self.cov_lot_nodes = data.lot_node_code(data.cov_lot, data.cov_node)
+        self.lot_node_demand = np.bincount(data.lot_node_code(data.demand_lot, data.demand_node), data.demand,
+                                           self.n_lot_nodes)
+
+    def cell_keys(self, cells):
+        return self.data.cell_keys(*self.data.cell_columns(cells))
+
+    def cap_keys(self, rows):
+        d = self.data
+        return d.cell_keys(d.cap_site[rows], d.cap_node[rows], d.cap_cell[rows])
+
+    def pair_keys(self, pairs):
+        d = self.data
+        return CodedKeys([d.site_ids, d.node_ids], list(np.divmod(pairs, d.n_nodes)))
+
+    def lot_node_keys(self):
+        d = self.data
+        return CodedKeys([d.lot_ids, d.node_ids], list(np.divmod(np.arange(self.n_lot_nodes), d.n_nodes)))
+
+
+class Family:
+    def __init__(self, name, sense, rhs, keys=None):
+        self.name = name
+        self.sense = sense
+        self.rhs = np.asarray(rhs, dtype=float)
+        self.keys = keys
+        self.blocks = dict()
+
+    def add_block(self, var_block, rows, cols, vals, n_cols):
+        A = sp.csr_matrix((np.asarray(vals, dtype=float), (np.asarray(rows, dtype=np.int64),
+                                                          np.asarray(cols, dtype=np.int64))),
+                          shape=(len(self.rhs), n_cols))
+        self.blocks[var_block] = A
+
+    @property
+    def num_rows(self):
+        return len(self.rhs)
+
+
+def _var_blocks(problem, index):
+    costs = variable_costs(problem.costs)
+    d = index.data
+    return [
+        ("v01NewSite", CodedKeys([d.site_ids], [index.potential_sites]), BINARY, costs["v01NewSite"]),
+        ("v01NewNode", index.pair_keys(index.potential_nodes), BINARY, costs["v01NewNode"]),
+        ("v01NewCell", index.cap_keys(index.potential_cells), BINARY, costs["v01NewCell"]),
+        ("v01UpgradeCell", index.cap_keys(index.existing_cells), BINARY, costs["v01UpgradeCell"]),
+        ("vFinalCapacity", index.cell_keys(index.capacity), CONTINUOUS, 0),
+        ("vTrafficOfCell", CodedKeys([d.site_ids, d.node_ids, d.cell_ids, d.lot_ids],
+                                     [d.cov_site, d.cov_node, d.cov_cell, d.cov_lot]), CONTINUOUS, 0),
+    ]
+
+
+def _min_cell_capacity(problem, index):
+    rows = index.existing_cells
+    f = Family("MinCellCapacity", GREATER_EQUAL, index.data.initial_capacity[rows])
+    f.add_block("vFinalCapacity", np.arange(len(rows)), index.cell_position[index.cap_cells[rows]],
+                np.ones(len(rows)), len(index.capacity))
+    return f
+
+
+def _max_cell_capacity_existing_cells(problem, index):
+    rows = index.existing_cells
+    initial, maximum = index.data.initial_capacity[rows], index.data.max_capacity[rows]
+    f = Family("MaxCellCapacityExistingCells", LESS_EQUAL, initial)
+    r = np.arange(len(rows))
+    f.add_block("vFinalCapacity", r, index.cell_position[index.cap_cells[rows]], np.ones(len(rows)),
+                len(index.capacity))
+    f.add_block("v01UpgradeCell", r, r, initial - maximum, len(index.existing_cells))
+    return f
+
+
+def _max_cell_capacity_new_cells(problem, index):
+    rows = index.potential_cells
+    f = Family("MaxCellCapacityNewCells", LESS_EQUAL, np.zeros(len(rows)))
+    r = np.arange(len(rows))
+    f.add_block("vFinalCapacity", r, index.cell_position[index.cap_cells[rows]], np.ones(len(rows)),
+                len(index.capacity))
+    f.add_block("v01NewCell", r, r, -index.data.max_capacity[rows], len(index.potential_cells))
+    return f
+
+
+def _new_cell_if_node_exists(problem, index):
+    d = index.data
+    rows = index.potential_cells
+    nodes = index.node_position[d.cap_site[rows].astype(np.int64) * d.n_nodes + d.cap_node[rows]]
+    cells = np.flatnonzero(nodes >= 0)
+    f = Family("NewCellIfNodeExists", LESS_EQUAL, np.zeros(len(cells)))
+    r = np.arange(len(cells))
+    f.add_block("v01NewCell", r, cells, np.ones(len(cells)), len(index.potential_cells))
+    f.add_block("v01NewNode", r, nodes[cells], -np.ones(len(cells)), len(index.potential_nodes))
+    return f
+
+
+def _new_node_if_site_exists(problem, index):
+    d = index.data
+    sites = index.potential_nodes // d.n_nodes
+    nodes = np.flatnonzero(sites >= d.n_existing_sites)
+    f = Family("NewNodeIfSiteExists", LESS_EQUAL, np.zeros(len(nodes)))
+    r = np.arange(len(nodes))
+    f.add_block("v01NewNode", r, nodes, np.ones(len(nodes)), len(index.potential_nodes))
+    f.add_block("v01NewSite", r, sites[nodes] - d.n_existing_sites, -np.ones(len(nodes)), len(index.potential_sites))
+    return f
+
+
+def _enough_global_capacity(problem, index):
+    d = index.data
+    n_cap = len(index.capacity)
+    f = Family("EnoughGlobalCapacity", GREATER_EQUAL, np.bincount(d.demand_node, d.demand, d.n_nodes),
+               d.node_ids.tolist())
+    if problem.sparse_capacity and not problem.legacy_global_capacity:
+        rows = (index.capacity // d.n_cells) % d.n_nodes
+        cols = np.arange(n_cap)
+    else:
+        rows = np.repeat(np.arange(d.n_nodes), n_cap)
+        cols = np.tile(np.arange(n_cap), d.n_nodes)
+    f.add_block("vFinalCapacity", rows, cols, np.ones(len(rows)), n_cap)
+    return f
+
+
+def _enough_capacity_per_lot(problem, index):
+    f = Family("EnoughCapacityPerLot", GREATER_EQUAL, index.lot_node_demand, index.lot_node_keys())
+    cols = index.cell_position[index.cov_cells]
+    has_capacity = cols >= 0
+    f.add_block("vFinalCapacity", index.cov_lot_nodes[has_capacity], cols[has_capacity],
+                np.ones(int(has_capacity.sum())), len(index.capacity))
+    return f
+
+
+def _max_traffic_of_cell(problem, index):
+    if problem.sparse_capacity:
+        row_cells = np.unique(index.cov_cells)
+    else:
+        row_cells = index.capacity
+    row_position = _positions(row_cells, len(index.cell_position))
+    f = Family("MaxTrafficOfCell", LESS_EQUAL, np.zeros(len(row_cells)), index.cell_keys(row_cells))
+    f.add_block("vTrafficOfCell", row_position[index.cov_cells], np.arange(index.n_coverage),
+                np.ones(index.n_coverage), index.n_coverage)
+    cols = index.cell_position[row_cells]
+    rows = np.flatnonzero(cols >= 0)
+    f.add_block("vFinalCapacity", rows, cols[rows], -np.ones(len(rows)), len(index.capacity))
+    return f
+
+
+def _demand_fullfilment(problem, index):
+    f = Family("DemandFullfilment", EQUAL, index.lot_node_demand, index.lot_node_keys())
+    f.add_block("vTrafficOfCell", index.cov_lot_nodes, np.arange(index.n_coverage), np.ones(index.n_coverage),
+                index.n_coverage)
+    return f
+
+
+def _all_or_none(name, var_block, index, rows):
+    # Consecutive cells of the same site and node take the same value
+    d = index.data
+    pairs = d.cap_site[rows].astype(np.int64) * d.n_nodes + d.cap_node[rows]
+    order = np.argsort(pairs, kind="stable")
+    chained = np.flatnonzero(pairs[order][1:] == pairs[order][:-1])
+    r = np.arange(len(chained))
+    f = Family(name, EQUAL, np.zeros(len(chained)))
+    f.add_block(var_block, np.concatenate([r, r]), np.concatenate([order[chained], order[chained + 1]]),
+                np.concatenate([np.ones(len(chained)), -np.ones(len(chained))]), len(rows))
+    return f
+
+
+def _all_or_none_new_cell(problem, index):
+    return _all_or_none("AllOrNoneNewCell", "v01NewCell", index, index.potential_cells)
+
+
+def _all_or_none_upgrade_cell(problem, index):
+    return _all_or_none("AllOrNoneUpgradeCell", "v01UpgradeCell", index, index.existing_cells)
+
+
+FAMILIES = [
+    _min_cell_capacity,
+    _max_cell_capacity_existing_cells,
+    _max_cell_capacity_new_cells,
+    _new_cell_if_node_exists,
+    _new_node_if_site_exists,
+    _enough_global_capacity,
+    _enough_capacity_per_lot,
+    _max_traffic_of_cell,
+    _demand_fullfilment,
+    _all_or_none_new_cell,
+    _all_or_none_upgrade_cell,
+]
+
+
+def build_matrix_model(problem, backend):
+    instrumentation = problem.instrumentation
+    with instrumentation.span("index"):
+        index = ModelIndex(problem.model_instance(), problem.sparse_capacity)
+
+    with instrumentation.span("variables"):
+        var_blocks = _var_blocks(problem, index)
+        backend.add_variables(var_blocks)
+        for vtype, name in [(BINARY, "binary"), (CONTINUOUS, "continuous")]:
+            instrumentation.count("variables/" + name, sum(len(keys) for _, keys, t, _ in var_blocks if t == vtype))
+
+    for family_builder in FAMILIES:
+        with instrumentation.span("family") as span:
+            f = family_builder(problem, index)
+            span.rename(f.name)
+            if f.num_rows > 0:
+                backend.add_family(f)
+            instrumentation.count("constraints/" + f.name, f.num_rows)
+
+    return index
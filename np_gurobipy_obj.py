@@ -4,191 +4,399 @@ import gurobipy as gp
 import os
 from gurobipy import GRB
 from read_data import read_data
-import time
+from matrix_model import build_matrix_model
+from solution_check import check_solution, report_to_text
+from solver_backends import make_backend
+from instrumentation import Instrumentation
+from solution_export import export_solution, save_solution, load_solution, solution_arrays
+from presolve import Reduction
+from np_instance import NPInstance
 import pickle
+from itertools import compress, product
+import numpy as np
+
+
+VAR_NAMES = ['v01NewSite', 'v01NewNode', 'v01NewCell', 'v01UpgradeCell', 'vFinalCapacity', 'vTrafficOfCell']
+# Tuple-keyed data of read_data and the index sets built on it. With an instance they are decoded on first use
+DATA_FIELDS = ('lots', 'sites', 'nodes', 'cells', 'existing_sites', 'potential_sites', 'initial_capacity',
+               'max_capacity', 'demand', 'coverage', 'existing_node_in_site', 'potential_node_in_site',
+               'existing_cell_in_site_node', 'potential_cell_in_site_node', 'site_cells_lighting_lot_node',
+               'lots_covered_by_site_node_cell', 'potential_sites_set', 'potential_node_in_site_set',
+               'existing_cell_in_site_node_set', 'potential_cell_in_site_node_set', 'existing_cells_by_site_node',
+               'potential_cells_by_site_node')
+# Variable and constraint dicts of the Gurobi matrix backend, built on first use
+MATRIX_DICTS = dict({name: ("vars", name) for name in VAR_NAMES},
+                    cEnoughGlobalCapacity=("constrs", "EnoughGlobalCapacity"),
+                    cEnoughCapacityPerLot=("constrs", "EnoughCapacityPerLot"),
+                    cDemandFullfilment=("constrs", "DemandFullfilment"))
+
+
+def group_cells_by_site_node(cells_in_site_node):
+    groups = dict()
+    for (s, n, c) in cells_in_site_node:
+        groups.setdefault((s, n), list()).append(c)
+    return groups
+
+
+def chained_cell_pairs(cells_by_site_node):
+    return [(s, n, group[k], group[k + 1]) for (s, n), group in cells_by_site_node.items()
+            for k in range(len(group) - 1)]
+
 
 class NP_problem:
-    def __init__(self, name, input_folder):
+    def __init__(self, name, input_folder=None, use_cache=False, instance=None, instrumentation=None, costs=None):
         self.name = name
+        # Spans and counters of every stage, see instrumentation.py. Pass instrumentation.DISABLED to turn it off
+        self.instrumentation = Instrumentation(name) if instrumentation is None else instrumentation
         self.input_folder = input_folder
-        self.lots = list()
-        self.sites = list()
-        self.nodes = list()
-        self.cells = list()
-        self.existing_sites = list()
-        self.potential_sites = list()
-        self.initial_capacity = dict()
-        self.max_capacity = dict()
-        self.demand = dict()
-        self.coverage = list()
-        self.existing_node_in_site = list()
-        self.potential_node_in_site = list()
-        self.existing_cell_in_site_node = list()
-        self.potential_cell_in_site_node = list()
-        self.site_cells_lighting_lot_node = list()
-        self.lots_covered_by_site_node_cell = list()
-        self.model = gp.Model("network_dimensioning")
+        self.use_cache = use_cache
+        self.factor = 10000
+        # Cost parameters, hard_coded_data.COSTS with the given ones changed. See update_costs
+        self.costs = make_costs(costs)
+        # With an instance the matrix builder and the solution checker read its code arrays, and the
+        # DATA_FIELDS are only decoded if something else asks for them
+        self.instance = instance
+        self.model = None
         self.solver_params = dict()
+        self.solver = "gurobi"
+        self.backend = None
+        self.reduction = None
+        self.sparse_capacity = False
+        self.legacy_global_capacity = False
+        self.build_times = dict()
         self.read_data()
         self.errors = dict()
         self.solution = dict()
         self.solution_check = ""
 
-    def read_data(self):
-        print("Reading data")
-        start_time = time.time()
-
-        self.lots, self.sites, self.nodes, self.cells, self.existing_sites, self.potential_sites, self.initial_capacity,\
-        self.max_capacity, self.demand, self.coverage, self.existing_node_in_site, self.potential_node_in_site, \
-        self.existing_cell_in_site_node, self.potential_cell_in_site_node, self.site_cells_lighting_lot_node,\
-        self.lots_covered_by_site_node_cell\
-            = read_data(self.input_folder)
+    def __getattr__(self, name):
+        # Only called for missing attributes
+        if name in DATA_FIELDS and self.__dict__.get("instance") is not None:
+            self.decode_instance()
+            return self.__dict__[name]
+        backend = self.__dict__.get("backend")
+        if name in MATRIX_DICTS and backend is not None and backend.name == "gurobi" and \
+                self.__dict__.get("reduction") is None:
+            kind, key = MATRIX_DICTS[name]
+            return getattr(backend, kind)[key]
+        raise AttributeError("'NP_problem' object has no attribute '{}'".format(name))
 
-        factor = 10000
-        self.initial_capacity = {i: self.initial_capacity[i]*factor for i in self.initial_capacity.keys()}
-        self.max_capacity = {i: self.max_capacity[i]*factor for i in self.max_capacity.keys()}
-        self.demand = {i: self.demand[i]*factor for i in self.demand.keys()}
-
-        print("Data read. Time: {}".format(time.time() - start_time))
+    def read_data(self):
+        instr = self.instrumentation
+        with instr.span("read_data"):
+            if self.instance is not None:
+                instr.count("lots", self.instance.n_lots)
+                instr.count("sites", self.instance.n_sites)
+                return
+            self.lots, self.sites, self.nodes, self.cells, self.existing_sites, self.potential_sites, self.initial_capacity,\
+            self.max_capacity, self.demand, self.coverage, self.existing_node_in_site, self.potential_node_in_site, \
+            self.existing_cell_in_site_node, self.potential_cell_in_site_node, self.site_cells_lighting_lot_node,\
+            self.lots_covered_by_site_node_cell\
+                = read_data(self.input_folder, self.use_cache, instr)
+            instr.count("lots", len(self.lots))
+            instr.count("sites", len(self.sites))
+            self.scale_data()
+
+    def decode_instance(self):
+        with self.instrumentation.span("decode_instance"):
+            self.lots, self.sites, self.nodes, self.cells, self.existing_sites, self.potential_sites, self.initial_capacity,\
+            self.max_capacity, self.demand, self.coverage, self.existing_node_in_site, self.potential_node_in_site, \
+            self.existing_cell_in_site_node, self.potential_cell_in_site_node, self.site_cells_lighting_lot_node,\
+            self.lots_covered_by_site_node_cell\
+                = self.instance.to_legacy()
+            self.scale_data()
+
+    def scale_data(self):
+        with self.instrumentation.span("scale and index sets"):
+            factor = self.factor
+            self.initial_capacity = {i: self.initial_capacity[i]*factor for i in self.initial_capacity.keys()}
+            self.max_capacity = {i: self.max_capacity[i]*factor for i in self.max_capacity.keys()}
+            self.demand = {i: self.demand[i]*factor for i in self.demand.keys()}
+            self.build_index_sets()
+
+    def model_instance(self):
+        # Instance in model units (capacity and demand times factor). The decoded data take over once they exist,
+        # since update_demand and the scenarios change them in place
+        if self.instance is not None and "demand" not in self.__dict__:
+            return self.instance.scaled(self.factor)
+        return NPInstance.from_problem(self)
+
+    def build_index_sets(self):
+        self.potential_sites_set = frozenset(self.potential_sites)
+        self.potential_node_in_site_set = frozenset(self.potential_node_in_site)
+        self.existing_cell_in_site_node_set = frozenset(self.existing_cell_in_site_node)
+        self.potential_cell_in_site_node_set = frozenset(self.potential_cell_in_site_node)
+        self.existing_cells_by_site_node = group_cells_by_site_node(self.existing_cell_in_site_node)
+        self.potential_cells_by_site_node = group_cells_by_site_node(self.potential_cell_in_site_node)
+
+    def capacity_keys(self):
+        # Capacity can only be non-zero where a cell exists or could be installed
+        if self.sparse_capacity:
+            return self.existing_cell_in_site_node + self.potential_cell_in_site_node
+        return list(product(self.sites, self.nodes, self.cells))
 
     def build_model(self):
-        start_time_g = time.time()
-        start_time = time.time()
-        self.model = gp.Model("network_dimensioning")
-        print("Building model")
-        self.v01NewSite = self.model.addVars(self.potential_sites,
-                                   vtype=GRB.BINARY,
-                                   obj=(pCAPEX_NEW_SITE + pOPEX_SITE),
-                                   name="v01NewSite")
-        self.v01NewNode = self.model.addVars(self.potential_node_in_site,
-                                   vtype=GRB.BINARY,
-                                   obj=(pCAPEX_NEW_NODE + pOPEX_NODE),
-                                   name="v01NewNode")
-        self.v01NewCell = self.model.addVars(self.potential_cell_in_site_node,
-                                   vtype=GRB.BINARY,
-                                   obj=pCAPEX_NEW_CELL,
-                                   name="v01NewCell")
-
-        self.v01UpgradeCell = self.model.addVars(self.existing_cell_in_site_node,
-                                       vtype=GRB.BINARY,
-                                       obj=pCAPEX_UPGRADE_CEll,
-                                       name="v01UpgradeCell")
-
-        self.vFinalCapacity = self.model.addVars(self.sites, self.nodes, self.cells,
-                                       vtype=GRB.CONTINUOUS,
-                                       lb=0,
-                                       obj=0,
-                                       name="vFinalCapacity")
-
-        self.vTrafficOfCell = self.model.addVars(self.coverage,
-                                       vtype=GRB.CONTINUOUS,
-                                       lb=0,
-                                       obj=0,
-                                       name="vTrafficOfCell")
-
-        print("Variables defined: {}".format(time.time() - start_time))
-
-        start_time = time.time()
-        self.model.ModelSense = GRB.MINIMIZE
-
-        # Min cell capacity
-        self.model.addConstrs((self.vFinalCapacity[i] >= self.initial_capacity[i] \
-                          for i in self.existing_cell_in_site_node),
-                         "MinCellCapacity")
-        print("MinCellCapacity constraint built: {}".format(time.time() - start_time))
-        start_time = time.time()
-
-        # Max cell capacity (when upgrading)
-        self.model.addConstrs((self.vFinalCapacity[i] <= self.initial_capacity[i] * (1 - self.v01UpgradeCell[i]) + \
-                          self.max_capacity[i] * self.v01UpgradeCell[i] \
-                          for i in self.existing_cell_in_site_node),
-                         "MaxCellCapacityExistingCells")
-        print("MaxCellCapacityExistingCells constraint built: {}".format(time.time() - start_time))
-        start_time = time.time()
-
-        # Max cell capacity (new cells)
-        self.model.addConstrs((self.vFinalCapacity[i] <= self.max_capacity[i] * self.v01NewCell[i] \
-                          for i in self.potential_cell_in_site_node),
-                         "MaxCellCapacityNewCells")
-        print("MaxCellCapacityNewCells constraint built: {}".format(time.time() - start_time))
-        start_time = time.time()
-
-        # New cell if node exists
-        self.model.addConstrs((self.v01NewCell[s, n, c] <= self.v01NewNode[s, n] \
-                          for (s, n, c) in self.potential_cell_in_site_node if (s, n) in self.potential_node_in_site),
-                         "NewCellIfNodeExists")
-        print("NewCellIfNodeExists constraint built: {}".format(time.time() - start_time))
-        start_time = time.time()
-
-        # New node if site exists
-        self.model.addConstrs((self.v01NewNode[s, n] <= self.v01NewSite[s] \
-                          for (s, n) in self.potential_node_in_site if s in self.potential_sites),
-                         "NewNodeIfSiteExists")
-        print("NewNodeIfSiteExists constraint built: {}".format(time.time() - start_time))
-        start_time = time.time()
-
-        # Enough global capacity
-        self.model.addConstrs((gp.quicksum(self.vFinalCapacity[s, n, c]
-                        for s in self.sites for n in self.nodes for c in self.cells)
-                        >=
-                        gp.quicksum(self.demand[l, n] for l in self.lots) \
-                        for n in self.nodes),
-                        "EnoughGlobalCapacity")
-        print("EnoughGlobalCapacity constraint built: {}".format(time.time() - start_time))
-        start_time = time.time()
-
-        # Enough capacity per lot
-        self.model.addConstrs((gp.quicksum(self.vFinalCapacity[s, n, c] for (s, c)
-                         in self.site_cells_lighting_lot_node[l, n])
-                          >=
-                          self.demand[l, n] for l in self.lots for n in self.nodes),
-                         "EnoughCapacityPerLot")
-        print("EnoughCapacityPerLot constraint built: {}".format(time.time() - start_time))
-        start_time = time.time()
-
-        # Max traffic of cell (depending on final capacity)
-        self.model.addConstrs(
-            (gp.quicksum(self.vTrafficOfCell[s, n, c, l] for l in self.lots_covered_by_site_node_cell[s, n, c])
-             <= self.vFinalCapacity[s, n, c]
-             for s in self.sites for n in self.nodes for c in self.cells),
-            "MaxTrafficOfCell")
-        print("MaxTrafficOfCell constraint built: {}".format(time.time() - start_time))
-
-        # Demand fullfilment
-        start_time = time.time()
-        self.model.addConstrs((gp.quicksum(self.vTrafficOfCell[i[0], n, i[1], l] for \
-                                           i in self.site_cells_lighting_lot_node[l, n]) == self.demand[l, n]
-                               for l in self.lots for n in self.nodes),
-                              "DemandFullfilment")
-        print("DemandFullfilment constraint built: {}".format(time.time() - start_time))
-        start_time = time.time()
-
-        # If installing new cells, all three are updated
-        self.model.addConstrs((self.v01NewCell[s, n, c] == self.v01NewCell[s, n, c2]
-            for s in self.sites for n in self.nodes for c in self.cells for c2 in self.cells
-            if (s, n, c) in self.potential_cell_in_site_node and (s, n, c2) in self.potential_cell_in_site_node),
-        "AllOrNoneNewCell")
-
-        # If installing new cells, all three are updated
-        self.model.addConstrs((self.v01UpgradeCell[s, n, c] == self.v01UpgradeCell[s, n, c2]
-                               for s in self.sites for n in self.nodes for c in self.cells for c2 in self.cells
-                               if (s, n, c) in self.existing_cell_in_site_node and (
-                               s, n, c2) in self.existing_cell_in_site_node),
-                              "AllOrNoneUpgradeCell")
-
-
-        print("Model built. Time: {}".format(time.time() - start_time_g))
+        # gurobipy builder, other solvers go through the matrix builders and solver_backends
+        if self.solver != "gurobi":
+            raise ValueError("build_model only builds Gurobi models, use build_model_matrix or build_model_presolved "
+                             "for solver {}".format(self.solver))
+        instr = self.instrumentation
+        self.backend = None
+        self.reduction = None
+        with instr.span("build_model"):
+            self.model = gp.Model("network_dimensioning")
+            costs = variable_costs(self.costs)
+            with instr.span("variables"):
+                self.v01NewSite = self.model.addVars(self.potential_sites,
+                                           vtype=GRB.BINARY,
+                                           obj=costs["v01NewSite"],
+                                           name="v01NewSite")
+                self.v01NewNode = self.model.addVars(self.potential_node_in_site,
+                                           vtype=GRB.BINARY,
+                                           obj=costs["v01NewNode"],
+                                           name="v01NewNode")
+                self.v01NewCell = self.model.addVars(self.potential_cell_in_site_node,
+                                           vtype=GRB.BINARY,
+                                           obj=costs["v01NewCell"],
+                                           name="v01NewCell")
+
+                self.v01UpgradeCell = self.model.addVars(self.existing_cell_in_site_node,
+                                               vtype=GRB.BINARY,
+                                               obj=costs["v01UpgradeCell"],
+                                               name="v01UpgradeCell")
+
+                self.vFinalCapacity = self.model.addVars(self.capacity_keys(),
+                                               vtype=GRB.CONTINUOUS,
+                                               lb=0,
+                                               obj=0,
+                                               name="vFinalCapacity")
+
+                self.vTrafficOfCell = self.model.addVars(self.coverage,
+                                               vtype=GRB.CONTINUOUS,
+                                               lb=0,
+                                               obj=0,
+                                               name="vTrafficOfCell")
+                instr.count("variables/binary", len(self.v01NewSite) + len(self.v01NewNode) + len(self.v01NewCell) +
+                            len(self.v01UpgradeCell))
+                instr.count("variables/continuous", len(self.vFinalCapacity) + len(self.vTrafficOfCell))
+
+            self.model.ModelSense = GRB.MINIMIZE
+
+            # Min cell capacity
+            with instr.span("MinCellCapacity"):
+                constrs = self.model.addConstrs((self.vFinalCapacity[i] >= self.initial_capacity[i] \
+                                  for i in self.existing_cell_in_site_node),
+                                 "MinCellCapacity")
+                instr.count("constraints/MinCellCapacity", len(constrs))
+
+            # Max cell capacity (when upgrading)
+            with instr.span("MaxCellCapacityExistingCells"):
+                constrs = self.model.addConstrs((self.vFinalCapacity[i] <= self.initial_capacity[i] * (1 - self.v01UpgradeCell[i]) + \
+                                  self.max_capacity[i] * self.v01UpgradeCell[i] \
+                                  for i in self.existing_cell_in_site_node),
+                                 "MaxCellCapacityExistingCells")
+                instr.count("constraints/MaxCellCapacityExistingCells", len(constrs))
+
+            # Max cell capacity (new cells)
+            with instr.span("MaxCellCapacityNewCells"):
+                constrs = self.model.addConstrs((self.vFinalCapacity[i] <= self.max_capacity[i] * self.v01NewCell[i] \
+                                  for i in self.potential_cell_in_site_node),
+                                 "MaxCellCapacityNewCells")
+                instr.count("constraints/MaxCellCapacityNewCells", len(constrs))
+
+            # New cell if node exists
+            with instr.span("NewCellIfNodeExists"):
+                constrs = self.model.addConstrs((self.v01NewCell[s, n, c] <= self.v01NewNode[s, n] \
+                                  for (s, n, c) in self.potential_cell_in_site_node if (s, n) in self.potential_node_in_site_set),
+                                 "NewCellIfNodeExists")
+                instr.count("constraints/NewCellIfNodeExists", len(constrs))
+
+            # New node if site exists
+            with instr.span("NewNodeIfSiteExists"):
+                constrs = self.model.addConstrs((self.v01NewNode[s, n] <= self.v01NewSite[s] \
+                                  for (s, n) in self.potential_node_in_site if s in self.potential_sites_set),
+                                 "NewNodeIfSiteExists")
+                instr.count("constraints/NewNodeIfSiteExists", len(constrs))
+
+            # Enough global capacity
+            with instr.span("EnoughGlobalCapacity"):
+                per_node = self.sparse_capacity and not self.legacy_global_capacity
+                self.cEnoughGlobalCapacity = self.model.addConstrs(((self.vFinalCapacity.sum('*', n, '*') if per_node else self.vFinalCapacity.sum())
+                                >=
+                                gp.quicksum(self.demand[l, n] for l in self.lots) \
+                                for n in self.nodes),
+                                "EnoughGlobalCapacity")
+                instr.count("constraints/EnoughGlobalCapacity", len(self.cEnoughGlobalCapacity))
+
+            # Enough capacity per lot
+            with instr.span("EnoughCapacityPerLot"):
+                self.cEnoughCapacityPerLot = self.model.addConstrs((gp.quicksum(self.vFinalCapacity[s, n, c] for (s, c)
+                                 in self.site_cells_lighting_lot_node[l, n] if (s, n, c) in self.vFinalCapacity)
+                                  >=
+                                  self.demand[l, n] for l in self.lots for n in self.nodes),
+                                 "EnoughCapacityPerLot")
+                instr.count("constraints/EnoughCapacityPerLot", len(self.cEnoughCapacityPerLot))
+
+            # Max traffic of cell (depending on final capacity)
+            with instr.span("MaxTrafficOfCell"):
+                if self.sparse_capacity:
+                    constrs = self.model.addConstrs(
+                        (gp.quicksum(self.vTrafficOfCell[s, n, c, l] for l in self.lots_covered_by_site_node_cell[s, n, c])
+                         <= self.vFinalCapacity.get((s, n, c), 0)
+                         for (s, n, c) in self.lots_covered_by_site_node_cell.keys()),
+                        "MaxTrafficOfCell")
+                else:
+                    constrs = self.model.addConstrs(
+                        (gp.quicksum(self.vTrafficOfCell[s, n, c, l] for l in self.lots_covered_by_site_node_cell[s, n, c])
+                         <= self.vFinalCapacity[s, n, c]
+                         for s in self.sites for n in self.nodes for c in self.cells),
+                        "MaxTrafficOfCell")
+                instr.count("constraints/MaxTrafficOfCell", len(constrs))
+
+            # Demand fullfilment
+            with instr.span("DemandFullfilment"):
+                self.cDemandFullfilment = self.model.addConstrs((gp.quicksum(self.vTrafficOfCell[i[0], n, i[1], l] for \
+                                                   i in self.site_cells_lighting_lot_node[l, n]) == self.demand[l, n]
+                                       for l in self.lots for n in self.nodes),
+                                      "DemandFullfilment")
+                instr.count("constraints/DemandFullfilment", len(self.cDemandFullfilment))
+
+            # If installing new cells, all three are updated
+            with instr.span("AllOrNoneNewCell"):
+                constrs = self.model.addConstrs((self.v01NewCell[s, n, c] == self.v01NewCell[s, n, c2]
+                                       for (s, n, c, c2) in chained_cell_pairs(self.potential_cells_by_site_node)),
+                                      "AllOrNoneNewCell")
+                instr.count("constraints/AllOrNoneNewCell", len(constrs))
+
+            # If upgrading cells, all three are upgraded
+            with instr.span("AllOrNoneUpgradeCell"):
+                constrs = self.model.addConstrs((self.v01UpgradeCell[s, n, c] == self.v01UpgradeCell[s, n, c2]
+                                       for (s, n, c, c2) in chained_cell_pairs(self.existing_cells_by_site_node)),
+                                      "AllOrNoneUpgradeCell")
+                instr.count("constraints/AllOrNoneUpgradeCell", len(constrs))
+
+        self.build_times = instr.times("build_model")
         # self.model.write("network_planning.lp")
 
+    def build_model_matrix(self):
+        instr = self.instrumentation
+        self.reduction = None
+        with instr.span("build_model"):
+            self.backend = make_backend(self.solver)
+            self.model = self.backend.model
+            self.index = build_matrix_model(self, self.backend)
+            # The variable and constraint dicts of a previous build_model are replaced by the backend ones,
+            # see __getattr__
+            for name in MATRIX_DICTS:
+                self.__dict__.pop(name, None)
+            if self.solver == "gurobi":
+                self.mvars = self.backend.mvars
+        self.build_times = instr.times("build_model")
+
+    def build_model_presolved(self):
+        # Reduced model, see presolve.Reduction. Its optimum is the one of the sparse_capacity model and
+        # gen_solution maps its solution back to the full model
+        instr = self.instrumentation
+        with instr.span("build_model"):
+            with instr.span("presolve"):
+                self.reduction = Reduction(self)
+            self.backend = make_backend(self.solver)
+            self.model = self.backend.model
+            self.reduction.build(self.backend, instr)
+        self.build_times = instr.times("build_model")
+
+    def update_demand(self, demand):
+        # Updates the RHS of the demand-dependent constraints of an already built model.
+        # demand is given in input units, as returned by read_data.read_demand
+        if self.reduction is not None:
+            raise ValueError("The presolved model depends on demand, it must be rebuilt")
+        demand = {i: demand[i] * self.factor for i in demand.keys()}
+        unknown = [i for i in demand.keys() if i not in self.demand]
+        if len(unknown) > 0:
+            raise ValueError("Demand for unknown lot-node pairs, model must be rebuilt: {}".format(unknown[:10]))
+        changed = [i for i in demand.keys() if demand[i] != self.demand[i]]
+        self.demand.update({i: demand[i] for i in changed})
+
+        nodes = sorted(set(n for (l, n) in changed), key=str)
+        updates = [("EnoughCapacityPerLot", changed, [self.demand[i] for i in changed]),
+                   ("DemandFullfilment", changed, [self.demand[i] for i in changed]),
+                   ("EnoughGlobalCapacity", nodes, [sum(self.demand[l, n] for l in self.lots) for n in nodes])]
+        if self.backend is not None:
+            for family, keys, rhs in updates:
+                self.backend.set_rhs(family, keys, rhs)
+        else:
+            constrs = dict(EnoughCapacityPerLot=self.cEnoughCapacityPerLot, DemandFullfilment=self.cDemandFullfilment,
+                           EnoughGlobalCapacity=self.cEnoughGlobalCapacity)
+            for family, keys, rhs in updates:
+                if len(keys) > 0:
+                    self.model.setAttr("RHS", [constrs[family][k] for k in keys], rhs)
+        self.instrumentation.count("demand_changed", len(changed))
+        return changed
+
+    def update_costs(self, costs):
+        # Changes the objective coefficients of an already built model. costs holds the cost parameters
+        # to change, as in hard_coded_data.COSTS
+        self.costs = make_costs(costs, self.costs)
+        if self.reduction is not None:
+            self.reduction.update_costs(self.backend)
+            return
+        for name, cost in variable_costs(self.costs).items():
+            if self.backend is not None:
+                self.backend.set_costs(name, cost)
+            else:
+                var_dict = getattr(self, name)
+                self.model.setAttr("Obj", list(var_dict.values()), [cost] * len(var_dict))
+
+    def set_mip_start(self, solution, include_capacity=True):
+        if self.reduction is not None:
+            raise ValueError("MIP starts are set on the full model variables, not on the presolved model")
+        start_vars = list()
+        start_values = list()
+        for var_dict, selected in [(self.v01NewSite, solution['new_sites']),
+                                   (self.v01NewNode, solution['new_nodes']),
+                                   (self.v01NewCell, solution['new_cells']),
+                                   (self.v01UpgradeCell, solution['upgraded_cells'])]:
+            selected = set(selected)
+            for key, var in var_dict.items():
+                start_vars.append(var)
+                start_values.append(1 if key in selected else 0)
+        if include_capacity:
+            for key, var in self.vFinalCapacity.items():
+                start_vars.append(var)
+                start_values.append(solution['final_capacity'].get(key, 0))
+        self.model.setAttr("Start", start_vars, start_values)
+
+    def load_mip_start(self, solution_path, include_capacity=True):
+        # .npz files are written by save_solution, anything else is read as a pickled solution dict
+        if solution_path.endswith(".npz"):
+            solution = load_solution(solution_path)
+        else:
+            with open(solution_path, 'rb') as handle:
+                solution = pickle.load(handle)
+        self.set_mip_start(solution, include_capacity)
+
     def set_solver_params(self):
+        if self.backend is not None:
+            self.backend.set_params(self.solver_params)
+            return
         for param in self.solver_params.keys():
             self.model.setParam(param, self.solver_params[param])
 
-    def solve_model(self):
+    def solve_model(self, callback=None):
+        instr = self.instrumentation
         self.set_solver_params()
-        self.model.optimize()
+        with instr.span("solve"):
+            if self.backend is not None and self.backend.name != "gurobi":
+                self.backend.solve(callback)
+            elif self.backend is not None:
+                self.backend.solve(instr.gurobi_callback(callback))
+            else:
+                self.model.optimize(instr.gurobi_callback(callback))
 
     def get_df_performance_data(self):
+        if self.backend is not None:
+            self.performance_data = dict(case=self.name, **self.backend.performance_data())
+            return
         self.performance_data = dict(
             case=self.name,
             obj_func=self.model.ObjVal,
@@ -196,75 +404,72 @@ class NP_problem:
             run_time=self.model.Runtime
         )
 
+    def has_solution(self):
+        if self.backend is not None:
+            return self.backend.has_solution()
+        return self.model.SolCount > 0
+
     def write_lp_file(self):
         self.model.write("network_planning.lp")
 
+    def var_keys(self, name):
+        if self.backend is not None:
+            return self.backend.keys[name]
+        return getattr(self, name).keys()
+
+    def var_values(self, name):
+        if self.backend is not None:
+            return self.backend.values(name)
+        return np.array(self.model.getAttr("X", list(getattr(self, name).values())), dtype=float)
+
     def gen_solution(self):
-        self.solution['new_sites'] = [s for s in self.potential_sites if self.v01NewSite[s].X == 1]
-        self.solution['new_nodes'] = [(s, n) for (s, n) in self.potential_node_in_site if self.v01NewNode[s, n].X == 1]
-        self.solution['new_cells'] = [(s, n, c) for (s, n, c) in self.potential_cell_in_site_node if self.v01NewCell[s, n, c].X == 1]
-        self.solution['upgraded_cells'] = [(s, n, c) for (s, n, c) in self.existing_cell_in_site_node if
-                                      self.v01UpgradeCell[s, n, c].X == 1]
-        self.solution['traffic_of_cell'] = {i: self.vTrafficOfCell[i].X for i in self.coverage}
-        self.solution['final_capacity'] = {(s, n, c): self.vFinalCapacity[s, n , c].X for s in self.sites for n in self.nodes for c in self.cells}
-
-    def output_df(self):
+        with self.instrumentation.span("gen_solution"):
+            self._gen_solution()
+
+    def _gen_solution(self):
+        if self.reduction is not None:
+            self.solution_values = dict()
+            self.solution.update(self.reduction.map_solution(self.backend))
+            return
+        self.solution_values = {name: self.var_values(name) for name in VAR_NAMES}
+        self.solution_from_values()
+
+    def solution_from_values(self):
+        self.solution['new_sites'] = list(compress(self.var_keys('v01NewSite'),
+                                                   self.solution_values['v01NewSite'] > 0.5))
+        self.solution['new_nodes'] = list(compress(self.var_keys('v01NewNode'),
+                                                   self.solution_values['v01NewNode'] > 0.5))
+        self.solution['new_cells'] = list(compress(self.var_keys('v01NewCell'),
+                                                   self.solution_values['v01NewCell'] > 0.5))
+        self.solution['upgraded_cells'] = list(compress(self.var_keys('v01UpgradeCell'),
+                                                        self.solution_values['v01UpgradeCell'] > 0.5))
+        # Traffic and capacity stay as arrays in solution_values, the dicts only hold the non-zero entries
+        for category in ['traffic_of_cell', 'final_capacity']:
+            keys, values = solution_arrays(self, category)
+            self.solution[category] = dict(zip(keys, values.tolist()))
+
+    def output_df(self, output_dir=".", formats=("parquet",)):
+        # Writes every solution category (non-zero traffic and capacity only) to output_dir,
+        # see solution_export.export_solution
         if len(self.solution.keys()) == 0:
             self.gen_solution()
-        # Traffic
-        df = pd.Series(self.solution["traffic_of_cell"]).reset_index()
-        df.columns = ["site", "node", "cell", "lot", "traffic" ]
-        df.to_csv("{}_traffic.csv".format(self.name))
-        # New sites
-        if len(self.solution["new_sites"]) > 0:
-            df = pd.Series(self.solution["new_sites"])
-            df.columns = ["site"]
-            df.to_csv("{}_new_sites.csv".format(self.name))
-        # New nodes
-        if len(self.solution["new_nodes"]) > 0:
-            df = pd.DataFrame.from_dict(self.solution["new_nodes"], orient="columns")
-            df.columns = ["site", "node"]
-            df.to_csv("{}_new_nodes.csv".format(self.name))
-        # New cells
-        if len(self.solution["new_cells"]) > 0:
-            df = pd.DataFrame.from_dict(self.solution["new_cells"], orient="columns")
-            df.columns = ["site", "node", "cell"]
-            df.to_csv("{}_new_cells.csv".format(self.name))
-        # Upgraded cells
-        if len(self.solution["upgraded_cells"]) > 0:
-            df = pd.DataFrame.from_dict(self.solution["upgraded_cells"], orient="columns")
-            df.columns = ["site", "node", "cell"]
-            df.to_csv("{}_upgraded_cells.csv".format(self.name))
-        pd.DataFrame(self.performance_data, index=[0]).to_csv("{}_general.csv".format(self.name))
-        return df
-
-    def check_solution(self):
+        with self.instrumentation.span("output_df"):
+            return export_solution(self, output_dir, formats)
+
+    def save_solution(self, solution_path):
         if len(self.solution.keys()) == 0:
             self.gen_solution()
+        with self.instrumentation.span("save_solution"):
+            save_solution(solution_path, self)
 
-        # Demand is met
-        # demand_unmet = [(l, n) for l in self.lots for n in self.nodes
-        #                 if self.demand[l, n] > sum(self.solution['traffic_of_cell'][s, n, c, l]
-        #                                           for s in self.sites for c in self.cells
-        #                                           if (s, n, c, l) in self.coverage)
-        #                ]
-        # if len(demand_unmet) > 0:
-        #     for (l, n) in demand_unmet:
-        #         self.solution_check += "ERROR. Demand not met. Lot {}, node {}\n".format(l, n)
-        # else:
-        #      self.solution_check += "OK. Demand constraint met"
-
-
-        # Capacity not violated
-        capacity_violated = [(s, n, c) for s in self.sites for n in self.nodes for c in self.cells
-                             if self.solution["final_capacity"][s, n, c] < sum(self.solution['traffic_of_cell'][s, n, c, l]
-                                                                   for l in self.lots if (s, n, c, l) in self.coverage)]
-        if len(capacity_violated) > 0:
-            for (s, n, c) in capacity_violated:
-                self.solution_check += "ERROR. Capacity violated. Site {}, node {}, cell {}\n".format(s, n, c)
-        else:
-             self.solution_check += "OK. Capacity not violated"
+    def check_solution(self, tol=1e-6):
+        if len(self.solution.keys()) == 0:
+            self.gen_solution()
+        with self.instrumentation.span("check_solution"):
+            self.errors = check_solution(self, self.solution, tol)
+        self.solution_check = report_to_text(self.errors)
         print(self.solution_check)
+        return all(len(v) == 0 for v in self.errors.values())
 
 def main():
     DATA_PATH = "..\..\..\datos_entrada\csv\casos_20220401"
@@ -274,7 +479,7 @@ def main():
     # case_path = "1000km2_0"
     # folder_path = os.path.join(DATA_PATH, case_path)
 
-    df_performance = pd.DataFrame(columns=["case", "obj_func", "gap", "run_time"])
+    performance_data = list()
 
     ordered_cases_paths_keys = list(cases_paths.keys())
     ordered_cases_paths_keys.sort()
@@ -285,13 +490,12 @@ def main():
         instance.solver_params = dict(TIME_LIMIT=6000, MIPGap=0.00)
         instance.solve_model()
         instance.get_df_performance_data()
-        df_performance = df_performance.append(instance.performance_data, ignore_index=True)
+        performance_data.append(instance.performance_data)
+        df_performance = pd.DataFrame(performance_data, columns=["case", "obj_func", "gap", "run_time"])
         df_performance.to_csv(os.path.join(DATA_PATH, "results_network_planning.csv"))
         instance.gen_solution()
-        df = instance.output_df()
-
-        with open(case, 'wb') as handle:
-            pickle.dump(instance.solution, handle, protocol=pickle.HIGHEST_PROTOCOL)
+        instance.output_df(os.path.join(DATA_PATH, "output", case))
+        instance.save_solution(os.path.join(DATA_PATH, "output", case, "{}.npz".format(case)))
 
     df_performance.to_csv("network_planning.csv")
 
@@ -0,0 +1,252 @@
+import copy
+
+import numpy as np
+import pandas as pd
+
+from fast_read_data import read_tables
+
+
+def _codes(values, categories, what):
+    codes = pd.Categorical(np.asarray(values), categories=categories).codes.astype(np.int32)
+    if (codes < 0).any():
+        raise ValueError("Unknown {} id in input data".format(what))
+    return codes
+
+
+def key_codes(keys, id_arrays, what):
+    # Code arrays, one per column, of tuple keys (or of single ids with one id array)
+    keys = list(keys)
+    if len(id_arrays) == 1:
+        return [_codes(keys, id_arrays[0], what[0])]
+    columns = list(zip(*keys)) if len(keys) > 0 else [[] for _ in id_arrays]
+    return [_codes(np.asarray(column, dtype=object), ids, w) for column, ids, w in zip(columns, id_arrays, what)]
+
+
+class CodedKeys:
+    # Keys of a model block held as code arrays and decoded to ids only when iterated or selected. With
+    # one column the keys are single ids, otherwise tuples
+    def __init__(self, id_arrays, code_arrays):
+        self.id_arrays = id_arrays
+        self.code_arrays = code_arrays
+
+    def __len__(self):
+        return len(self.code_arrays[0])
+
+    def select(self, mask=slice(None)):
+        columns = [ids[codes[mask]].tolist() for ids, codes in zip(self.id_arrays, self.code_arrays)]
+        return columns[0] if len(columns) == 1 else list(zip(*columns))
+
+    def __iter__(self):
+        for start in range(0, len(self), 100000):
+            yield from self.select(slice(start, start + 100000))
+
+
+def _csr(keys, n_keys):
+    order = np.argsort(keys, kind="stable").astype(np.int32)
+    indptr = np.zeros(n_keys + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys, minlength=n_keys), out=indptr[1:])
+    return indptr, order
+
+
+class NPInstance:
+    # Integer-encoded instance. Site, node, cell and lot ids are stored once in the *_ids arrays and
+    # referenced everywhere else by int32 codes. The matrix model builder and the solution checker read
+    # these arrays, and ids are decoded only for the output (see CodedKeys). to_legacy decodes the
+    # tuple-keyed structures of read_data for the Gurobi builder, the presolve and the heuristic.
+    def __init__(self, site_ids, node_ids, cell_ids, lot_ids, n_existing_sites,
+                 cap_site, cap_node, cap_cell, initial_capacity, max_capacity,
+                 demand_lot, demand_node, demand,
+                 cov_site, cov_node, cov_cell, cov_lot):
+        self.site_ids = np.asarray(site_ids, dtype=object)
+        self.node_ids = np.asarray(node_ids, dtype=object)
+        self.cell_ids = np.asarray(cell_ids, dtype=object)
+        self.lot_ids = np.asarray(lot_ids, dtype=object)
+        self.n_existing_sites = int(n_existing_sites)
+
+        # One entry per (site, node, cell) of capacityi.csv
+        self.cap_site = np.asarray(cap_site, dtype=np.int32)
+        self.cap_node = np.asarray(cap_node, dtype=np.int32)
+        self.cap_cell = np.asarray(cap_cell, dtype=np.int32)
+        self.initial_capacity = np.asarray(initial_capacity, dtype=np.float64)
+        self.max_capacity = np.asarray(max_capacity, dtype=np.float64)
+
+        # One entry per (lot, node) of traffic_demand.csv
+        self.demand_lot = np.asarray(demand_lot, dtype=np.int32)
+        self.demand_node = np.asarray(demand_node, dtype=np.int32)
+        self.demand = np.asarray(demand, dtype=np.float64)
+
+        # One entry per (site, node, cell, lot) of coverage.csv
+        self.cov_site = np.asarray(cov_site, dtype=np.int32)
+        self.cov_node = np.asarray(cov_node, dtype=np.int32)
+        self.cov_cell = np.asarray(cov_cell, dtype=np.int32)
+        self.cov_lot = np.asarray(cov_lot, dtype=np.int32)
+
+        # CSR adjacency: lot-node -> coverage rows, and site-node-cell -> coverage rows
+        self.lot_node_indptr, self.lot_node_rows = _csr(self.lot_node_code(self.cov_lot, self.cov_node),
+                                                        self.n_lots * self.n_nodes)
+        self.cell_indptr, self.cell_rows = _csr(self.cell_code(self.cov_site, self.cov_node, self.cov_cell),
+                                                self.n_sites * self.n_nodes * self.n_cells)
+
+    @property
+    def n_sites(self):
+        return len(self.site_ids)
+
+    @property
+    def n_nodes(self):
+        return len(self.node_ids)
+
+    @property
+    def n_cells(self):
+        return len(self.cell_ids)
+
+    @property
+    def n_lots(self):
+        return len(self.lot_ids)
+
+    @property
+    def n_coverage(self):
+        return len(self.cov_lot)
+
+    def lot_node_code(self, lot, node):
+        return lot.astype(np.int64) * self.n_nodes + node
+
+    def cell_code(self, site, node, cell):
+        return (site.astype(np.int64) * self.n_nodes + node) * self.n_cells + cell
+
+    def cell_columns(self, code):
+        # Site, node and cell codes of site-node-cell codes
+        site, rest = np.divmod(code, self.n_nodes * self.n_cells)
+        return [site, *np.divmod(rest, self.n_cells)]
+
+    @property
+    def cap_is_existing(self):
+        return self.initial_capacity > 0
+
+    @classmethod
+    def from_tables(cls, tables):
+        existing_sites = tables["existing_sites"].site_id.drop_duplicates().to_numpy(dtype=object)
+        potential_sites = tables["potential_sites"].site_id.drop_duplicates().to_numpy(dtype=object)
+        site_ids = np.concatenate([existing_sites, potential_sites])
+        df_demand = tables["demand"]
+        df_coverage = tables["coverage"].drop_duplicates(["site_id", "node", "cell", "lot_id"])
+        node_ids = df_demand.node.drop_duplicates().to_numpy(dtype=object)
+        lot_ids = df_demand.lot_id.drop_duplicates().to_numpy(dtype=object)
+        cell_ids = tables["coverage"].cell.drop_duplicates().to_numpy(dtype=object)
+
+        df_capacity = tables["initial_capacity"].merge(tables["potential_capacity"], how="left",
+                                                       on=["site_id", "node", "cell"], suffixes=("", "_max"))
+
+        return cls(site_ids, node_ids, cell_ids, lot_ids, len(existing_sites),
+                   _codes(df_capacity.site_id, site_ids, "site"),
+                   _codes(df_capacity.node, node_ids, "node"),
+                   _codes(df_capacity.cell, cell_ids, "cell"),
+                   df_capacity.capacity.to_numpy(dtype=np.float64),
+                   df_capacity.capacity_max.to_numpy(dtype=np.float64),
+                   _codes(df_demand.lot_id, lot_ids, "lot"),
+                   _codes(df_demand.node, node_ids, "node"),
+                   df_demand.demand.to_numpy(dtype=np.float64),
+                   _codes(df_coverage.site_id, site_ids, "site"),
+                   _codes(df_coverage.node, node_ids, "node"),
+                   _codes(df_coverage.cell, cell_ids, "cell"),
+                   _codes(df_coverage.lot_id, lot_ids, "lot"))
+
+    @classmethod
+    def from_folder(cls, folder_path, **kwargs):
+        return cls.from_tables(read_tables(folder_path, **kwargs))
+
+    @classmethod
+    def from_problem(cls, problem):
+        # Encodes the tuple-keyed data of an NP_problem, in its (scaled) units
+        site_ids = np.asarray(list(problem.sites), dtype=object)
+        node_ids = np.asarray(list(problem.nodes), dtype=object)
+        cell_ids = np.asarray(list(problem.cells), dtype=object)
+        lot_ids = np.asarray(list(problem.lots), dtype=object)
+        cap_keys = list(problem.initial_capacity.keys())
+        return cls(site_ids, node_ids, cell_ids, lot_ids, len(problem.existing_sites),
+                   *key_codes(cap_keys, [site_ids, node_ids, cell_ids], ["site", "node", "cell"]),
+                   list(problem.initial_capacity.values()),
+                   [problem.max_capacity.get(k, np.nan) for k in cap_keys],
+                   *key_codes(problem.demand.keys(), [lot_ids, node_ids], ["lot", "node"]),
+                   list(problem.demand.values()),
+                   *key_codes(problem.coverage, [site_ids, node_ids, cell_ids, lot_ids],
+                              ["site", "node", "cell", "lot"]))
+
+    def scaled(self, factor):
+        # Copy sharing the code arrays, with capacity and demand multiplied by factor
+        scaled = copy.copy(self)
+        scaled.initial_capacity = self.initial_capacity * factor
+        scaled.max_capacity = self.max_capacity * factor
+        scaled.demand = self.demand * factor
+        return scaled
+
+    def cell_keys(self, site, node, cell):
+        return CodedKeys([self.site_ids, self.node_ids, self.cell_ids], [site, node, cell])
+
+    def subset(self, lot_codes):
+        # Sub-instance with the given lots, the sites covering them and all the cells of those sites
+        lot_mask = np.zeros(self.n_lots, dtype=bool)
+        lot_mask[lot_codes] = True
+        cov_mask = lot_mask[self.cov_lot]
+        site_mask = np.zeros(self.n_sites, dtype=bool)
+        site_mask[self.cov_site[cov_mask]] = True
+        site_map = np.cumsum(site_mask, dtype=np.int64) - 1
+        lot_map = np.cumsum(lot_mask, dtype=np.int64) - 1
+        cap_mask = site_mask[self.cap_site]
+        demand_mask = lot_mask[self.demand_lot]
+        return NPInstance(self.site_ids[site_mask], self.node_ids, self.cell_ids, self.lot_ids[lot_mask],
+                          site_mask[:self.n_existing_sites].sum(),
+                          site_map[self.cap_site[cap_mask]], self.cap_node[cap_mask], self.cap_cell[cap_mask],
+                          self.initial_capacity[cap_mask], self.max_capacity[cap_mask],
+                          lot_map[self.demand_lot[demand_mask]], self.demand_node[demand_mask],
+                          self.demand[demand_mask],
+                          site_map[self.cov_site[cov_mask]], self.cov_node[cov_mask], self.cov_cell[cov_mask],
+                          lot_map[self.cov_lot[cov_mask]])
+
+    def nbytes(self):
+        return sum(v.nbytes for v in vars(self).values() if isinstance(v, np.ndarray) and v.dtype != object)
+
+    def to_legacy(self):
+        # Decodes the instance into the tuple returned by read_data.read_data
+        sites = self.site_ids.tolist()
+        existing_sites = sites[:self.n_existing_sites]
+        potential_sites = sites[self.n_existing_sites:]
+        s, n, c = self.site_ids[self.cap_site].tolist(), self.node_ids[self.cap_node].tolist(), \
+                  self.cell_ids[self.cap_cell].tolist()
+        cap_keys = list(zip(s, n, c))
+        is_existing = self.cap_is_existing.tolist()
+        initial_capacity = dict(zip(cap_keys, self.initial_capacity.tolist()))
+        max_capacity = {k: v for k, v in zip(cap_keys, self.max_capacity.tolist()) if not np.isnan(v)}
+        existing_cell_in_site_node = [k for k, e in zip(cap_keys, is_existing) if e]
+        potential_cell_in_site_node = [k for k, e in zip(cap_keys, is_existing) if not e]
+        existing_node_in_site = list(dict.fromkeys((k[0], k[1]) for k in existing_cell_in_site_node))
+        existing_node_set = set(existing_node_in_site)
+        potential_node_in_site = [(st, nd) for st in sites for nd in self.node_ids.tolist()
+                                  if (st, nd) not in existing_node_set]
+
+        demand = dict(zip(zip(self.lot_ids[self.demand_lot].tolist(), self.node_ids[self.demand_node].tolist()),
+                          self.demand.tolist()))
+
+        cov_s, cov_n = self.site_ids[self.cov_site].tolist(), self.node_ids[self.cov_node].tolist()
+        cov_c, cov_l = self.cell_ids[self.cov_cell].tolist(), self.lot_ids[self.cov_lot].tolist()
+        coverage = list(zip(cov_s, cov_n, cov_c, cov_l))
+
+        site_cells_lighting_lot_node = dict()
+        indptr = self.lot_node_indptr.tolist()
+        rows = self.lot_node_rows.tolist()
+        for key in np.flatnonzero(np.diff(self.lot_node_indptr)).tolist():
+            l, nd = divmod(key, self.n_nodes)
+            site_cells_lighting_lot_node[self.lot_ids[l], self.node_ids[nd]] = \
+                [(cov_s[r], cov_c[r]) for r in rows[indptr[key]:indptr[key + 1]]]
+
+        lots_covered_by_site_node_cell = dict()
+        indptr = self.cell_indptr.tolist()
+        rows = self.cell_rows.tolist()
+        for key in np.flatnonzero(np.diff(self.cell_indptr)).tolist():
+            r0 = rows[indptr[key]]
+            lots_covered_by_site_node_cell[cov_s[r0], cov_n[r0], cov_c[r0]] = \
+                [cov_l[r] for r in rows[indptr[key]:indptr[key + 1]]]
+
+        return self.lot_ids, sites, self.node_ids, self.cell_ids, existing_sites, potential_sites, \
+               initial_capacity, max_capacity, demand, coverage, existing_node_in_site, potential_node_in_site, \
+               existing_cell_in_site_node, potential_cell_in_site_node, site_cells_lighting_lot_node, \
+               lots_covered_by_site_node_cell
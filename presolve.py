@@ -0,0 +1,237 @@
+from collections import defaultdict
+
+import numpy as np
+
+from hard_coded_data import *
+from matrix_model import Family, BINARY, CONTINUOUS, LESS_EQUAL, EQUAL
+
+EPS = 1e-9
+
+
+class Reduction:
+    # Reduced formulation of the sparse_capacity model, built from the loaded data:
+    # - traffic to lot-nodes without demand, or through cells without capacity, is removed
+    # - a lot-node covered by a single cell gets its demand as fixed traffic on that cell
+    # - cells that cover no demanded lot are removed (they still count in the cost of their group)
+    # - EnoughCapacityPerLot and EnoughGlobalCapacity are implied by MaxTrafficOfCell and
+    #   DemandFullfilment and are not built
+    # - capacity variables are replaced by their upper bound in MaxTrafficOfCell, as capacity has no cost
+    # - each all-or-none group of new (upgraded) cells of a site-node is a single binary, which also
+    #   carries the new node when the node is potential
+    # - groups that fixed traffic forces open are removed with their site, their cost goes to the
+    #   objective offset
+    def __init__(self, problem):
+        self.problem = problem
+        # Demand the reduction is built for
+        self.demand = problem.demand
+        self.stats = dict()
+        self._reduce_traffic()
+        self._reduce_groups()
+
+    def _reduce_traffic(self):
+        p = self.problem
+        cells_of_lot_node = defaultdict(list)
+        for (s, n, c, l) in p.coverage:
+            if p.demand.get((l, n), 0) > EPS and self._has_capacity((s, n, c)):
+                cells_of_lot_node[l, n].append((s, c))
+        uncovered = [k for k, d in p.demand.items() if d > EPS and k not in cells_of_lot_node]
+        if len(uncovered) > 0:
+            raise ValueError("Lot-node pairs with demand and no cell able to serve them: {}".format(uncovered[:10]))
+
+        self.fixed_traffic = dict()
+        self.free_lot_nodes = dict()
+        self.load = defaultdict(float)
+        for (l, n), cells in cells_of_lot_node.items():
+            if len(cells) == 1:
+                s, c = cells[0]
+                self.fixed_traffic[s, n, c, l] = p.demand[l, n]
+                self.load[s, n, c] += p.demand[l, n]
+            else:
+                self.free_lot_nodes[l, n] = [(s, n, c, l) for (s, c) in cells]
+        self.traffic_of_cell = defaultdict(list)
+        for keys in self.free_lot_nodes.values():
+            for (s, n, c, l) in keys:
+                self.traffic_of_cell[s, n, c].append((s, n, c, l))
+        self.useful_cells = set(self.traffic_of_cell) | set(self.load)
+        self.stats.update(coverage_rows=len(p.coverage), fixed_traffic=len(self.fixed_traffic),
+                          free_traffic=sum(len(k) for k in self.free_lot_nodes.values()),
+                          removed_cells=len(p.existing_cell_in_site_node) + len(p.potential_cell_in_site_node) -
+                                        len(self.useful_cells))
+
+    def _has_capacity(self, cell):
+        p = self.problem
+        if cell in p.existing_cell_in_site_node_set:
+            return True
+        return cell in p.potential_cell_in_site_node_set and p.max_capacity[cell] > EPS
+
+    def _can_upgrade(self, group):
+        p = self.problem
+        return all(p.max_capacity[(group[0], group[1], c)] >= p.initial_capacity[(group[0], group[1], c)]
+                   for c in p.existing_cells_by_site_node[group])
+
+    def cell_capacity(self, cell):
+        # Capacity of a cell when its group is off, and extra capacity when it is on
+        p = self.problem
+        if cell in p.existing_cell_in_site_node_set:
+            return p.initial_capacity[cell], max(p.max_capacity[cell] - p.initial_capacity[cell], 0)
+        return 0, p.max_capacity[cell]
+
+    def _reduce_groups(self):
+        p = self.problem
+        self.new_groups = sorted({(s, n) for (s, n, c) in self.useful_cells
+                                  if (s, n, c) in p.potential_cell_in_site_node_set}, key=str)
+        self.upgrade_groups = sorted({(s, n) for (s, n, c) in self.useful_cells
+                                      if (s, n, c) in p.existing_cell_in_site_node_set and self._can_upgrade((s, n))},
+                                     key=str)
+        upgradable = set(self.upgrade_groups)
+
+        self.forced_new, self.forced_upgrade = set(), set()
+        for cell, load in self.load.items():
+            base, extra = self.cell_capacity(cell)
+            if cell in p.existing_cell_in_site_node_set and cell[:2] not in upgradable:
+                extra = 0
+            if load > base + extra + EPS * max(1, load):
+                raise ValueError("Demand of the lots only covered by cell {} exceeds its capacity".format(cell))
+            if load > base + EPS * max(1, load):
+                (self.forced_new if cell in p.potential_cell_in_site_node_set else self.forced_upgrade).add(cell[:2])
+
+        self.site_of_group = {(s, n): s for (s, n) in self.new_groups
+                              if (s, n) in p.potential_node_in_site_set and s in p.potential_sites_set}
+        self.sites = sorted(set(self.site_of_group.values()), key=str)
+        self.forced_sites = {self.site_of_group[g] for g in self.forced_new if g in self.site_of_group}
+
+        self.free_sites = [s for s in self.sites if s not in self.forced_sites]
+        self.free_new = [g for g in self.new_groups if g not in self.forced_new]
+        self.free_upgrade = [g for g in self.upgrade_groups if g not in self.forced_upgrade]
+        self.free_traffic = [k for keys in self.free_lot_nodes.values() for k in keys]
+        self.stats.update(new_groups=len(self.new_groups), upgrade_groups=len(self.upgrade_groups),
+                          forced_new_groups=len(self.forced_new), forced_upgrade_groups=len(self.forced_upgrade),
+                          forced_sites=len(self.forced_sites))
+
+    # Costs are read from problem.costs on every call, so update_costs only has to reset the objective
+    def site_cost(self):
+        return variable_costs(self.problem.costs)["v01NewSite"]
+
+    def new_group_cost(self, group):
+        costs = variable_costs(self.problem.costs)
+        cost = len(self.problem.potential_cells_by_site_node[group]) * costs["v01NewCell"]
+        if group in self.problem.potential_node_in_site_set:
+            cost += costs["v01NewNode"]
+        return cost
+
+    def upgrade_group_cost(self, group):
+        costs = variable_costs(self.problem.costs)
+        return len(self.problem.existing_cells_by_site_node[group]) * costs["v01UpgradeCell"]
+
+    def objective_offset(self):
+        # Cost of the sites and groups that fixed traffic forces open
+        return len(self.forced_sites) * self.site_cost() + \
+               sum(self.new_group_cost(g) for g in self.forced_new) + \
+               sum(self.upgrade_group_cost(g) for g in self.forced_upgrade)
+
+    def var_blocks(self):
+        return [
+            ("vNewSite", {s: i for i, s in enumerate(self.free_sites)}, BINARY, self.site_cost()),
+            ("vNewGroup", {g: i for i, g in enumerate(self.free_new)}, BINARY,
+             np.array([self.new_group_cost(g) for g in self.free_new], dtype=float)),
+            ("vUpgradeGroup", {g: i for i, g in enumerate(self.free_upgrade)}, BINARY,
+             np.array([self.upgrade_group_cost(g) for g in self.free_upgrade], dtype=float)),
+            ("vTrafficOfCell", {k: i for i, k in enumerate(self.free_traffic)}, CONTINUOUS, 0),
+        ]
+
+    def _max_traffic_of_cell(self, index):
+        # Sum of free traffic <= base + extra * group - fixed traffic
+        p = self.problem
+        cells = list(self.traffic_of_cell)
+        rhs, t_rows, t_cols, new_rows, new_cols, new_vals, upg_rows, upg_cols, upg_vals = \
+            [], [], [], [], [], [], [], [], []
+        for row, cell in enumerate(cells):
+            base, extra = self.cell_capacity(cell)
+            group = cell[:2]
+            is_new = cell in p.potential_cell_in_site_node_set
+            if is_new and group in self.forced_new or not is_new and group in self.forced_upgrade:
+                base += extra
+            elif is_new:
+                new_rows.append(row), new_cols.append(index["vNewGroup"][group]), new_vals.append(-extra)
+            elif group in index["vUpgradeGroup"]:
+                upg_rows.append(row), upg_cols.append(index["vUpgradeGroup"][group]), upg_vals.append(-extra)
+            rhs.append(base - self.load.get(cell, 0))
+            for key in self.traffic_of_cell[cell]:
+                t_rows.append(row), t_cols.append(index["vTrafficOfCell"][key])
+        f = Family("MaxTrafficOfCell", LESS_EQUAL, rhs)
+        f.add_block("vTrafficOfCell", t_rows, t_cols, np.ones(len(t_rows)), len(index["vTrafficOfCell"]))
+        f.add_block("vNewGroup", new_rows, new_cols, new_vals, len(index["vNewGroup"]))
+        f.add_block("vUpgradeGroup", upg_rows, upg_cols, upg_vals, len(index["vUpgradeGroup"]))
+        return f
+
+    def _demand_fullfilment(self, index):
+        # Only lot-nodes with more than one covering cell
+        lot_nodes = list(self.free_lot_nodes)
+        rows = [row for row, k in enumerate(lot_nodes) for _ in self.free_lot_nodes[k]]
+        cols = [index["vTrafficOfCell"][key] for k in lot_nodes for key in self.free_lot_nodes[k]]
+        f = Family("DemandFullfilment", EQUAL, [self.problem.demand[k] for k in lot_nodes])
+        f.add_block("vTrafficOfCell", rows, cols, np.ones(len(rows)), len(index["vTrafficOfCell"]))
+        return f
+
+    def _new_node_if_site_exists(self, index):
+        # New group (cells and node) only if the site is new
+        groups = [g for g in self.free_new if g in self.site_of_group and self.site_of_group[g] not in self.forced_sites]
+        rows = range(len(groups))
+        f = Family("NewNodeIfSiteExists", LESS_EQUAL, np.zeros(len(groups)))
+        f.add_block("vNewGroup", rows, [index["vNewGroup"][g] for g in groups], np.ones(len(groups)),
+                    len(index["vNewGroup"]))
+        f.add_block("vNewSite", rows, [index["vNewSite"][self.site_of_group[g]] for g in groups],
+                    -np.ones(len(groups)), len(index["vNewSite"]))
+        return f
+
+    def build(self, backend, instrumentation):
+        with instrumentation.span("variables"):
+            var_blocks = self.var_blocks()
+            backend.add_variables(var_blocks)
+            backend.set_objective_offset(self.objective_offset())
+            for vtype, name in [(BINARY, "binary"), (CONTINUOUS, "continuous")]:
+                instrumentation.count("variables/" + name,
+                                      sum(len(keys) for _, keys, t, _ in var_blocks if t == vtype))
+        index = {name: keys for name, keys, _, _ in var_blocks}
+        for family_builder in [self._max_traffic_of_cell, self._demand_fullfilment, self._new_node_if_site_exists]:
+            with instrumentation.span("family") as span:
+                f = family_builder(index)
+                span.rename(f.name)
+                if f.num_rows > 0:
+                    backend.add_family(f)
+                instrumentation.count("constraints/" + f.name, f.num_rows)
+        for name, value in self.stats.items():
+            instrumentation.count("presolve/" + name, value)
+
+    def update_costs(self, backend):
+        for name, _, _, obj in self.var_blocks():
+            backend.set_costs(name, obj)
+        backend.set_objective_offset(self.objective_offset())
+
+    def map_solution(self, backend):
+        # Solution of the full model, in the format of NP_problem.gen_solution
+        p = self.problem
+        selected = lambda name, keys: [k for k, v in zip(keys, backend.values(name)) if v > 0.5]
+        new_sites = set(selected("vNewSite", self.free_sites)) | self.forced_sites
+        new_groups = set(selected("vNewGroup", self.free_new)) | self.forced_new
+        upgrade_groups = set(selected("vUpgradeGroup", self.free_upgrade)) | self.forced_upgrade
+
+        solution = dict()
+        solution["new_sites"] = [s for s in p.potential_sites if s in new_sites]
+        solution["new_nodes"] = [g for g in p.potential_node_in_site if g in new_groups]
+        solution["new_cells"] = [k for k in p.potential_cell_in_site_node if k[:2] in new_groups]
+        solution["upgraded_cells"] = [k for k in p.existing_cell_in_site_node if k[:2] in upgrade_groups]
+
+        # Capacity at its upper bound, which is feasible for every constraint of the full model
+        capacity = dict()
+        for k in p.existing_cell_in_site_node:
+            base, extra = self.cell_capacity(k)
+            capacity[k] = base + extra if k[:2] in upgrade_groups else base
+        for k in p.potential_cell_in_site_node:
+            capacity[k] = p.max_capacity[k] if k[:2] in new_groups else 0
+        solution["final_capacity"] = {k: capacity[k] for k in p.capacity_keys() if capacity.get(k, 0) != 0}
+
+        traffic = dict(zip(self.free_traffic, backend.values("vTrafficOfCell").tolist()))
+        traffic.update(self.fixed_traffic)
+        solution["traffic_of_cell"] = {k: t for k, t in traffic.items() if abs(t) > 1e-9}
+        return solution
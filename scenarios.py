@@ -0,0 +1,187 @@
+import argparse
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from hard_coded_data import COSTS, make_costs
+
+SCENARIO_COLUMNS = ["scenario", "demand_multiplier"] + list(COSTS)
+
+
+def scenario(name, demand_multiplier=1.0, **costs):
+    # costs are absolute values of the cost parameters (hard_coded_data.COSTS) that differ from the base case
+    make_costs(costs)
+    return dict(name=name, demand_multiplier=demand_multiplier, costs=costs)
+
+
+def scenario_grid(demand_multipliers=(1.0,), cost_multipliers=(1.0,), cost_parameters=None, base_costs=None):
+    # Every demand multiplier combined with every multiplier of the given cost parameters (all by default)
+    base_costs = make_costs(base_costs)
+    cost_parameters = list(COSTS) if cost_parameters is None else cost_parameters
+    return [scenario("d{}_c{}".format(d, c), d, **{p: base_costs[p] * c for p in cost_parameters})
+            for d in demand_multipliers for c in cost_multipliers]
+
+
+def read_scenarios(path):
+    # CSV with a scenario column, an optional demand_multiplier column and a column per cost parameter
+    # to change. Empty cells keep the base value
+    df = pd.read_csv(path)
+    unknown = [c for c in df.columns if c not in SCENARIO_COLUMNS]
+    if len(unknown) > 0:
+        raise ValueError("Unknown scenario columns {}. Available: {}".format(unknown, SCENARIO_COLUMNS))
+    scenarios = list()
+    for row in df.to_dict("records"):
+        multiplier = row.get("demand_multiplier", 1.0)
+        scenarios.append(scenario(str(row["scenario"]), 1.0 if pd.isna(multiplier) else multiplier,
+                                  **{p: row[p] for p in COSTS if p in row and not pd.isna(row[p])}))
+    return scenarios
+
+
+def shard_scenarios(scenarios, n_shards):
+    # Contiguous shards, so that each scenario is warm started from a neighbour of the list
+    n = len(scenarios)
+    return [scenarios[k * n // n_shards:(k + 1) * n // n_shards] for k in range(n_shards)]
+
+
+def apply_scenario(problem, scenario, base_costs, base_demand):
+    # Only objective coefficients and demand RHS change, the model is not rebuilt
+    problem.update_costs(dict(base_costs, **scenario["costs"]))
+    demand = {i: base_demand[i] * scenario["demand_multiplier"] for i in base_demand.keys()}
+    if problem.reduction is None:
+        problem.update_demand({i: demand[i] / problem.factor for i in demand.keys()})
+    elif demand != problem.reduction.demand:
+        # The presolved model depends on demand, so its build stage is repeated (data are not read again)
+        problem.demand = demand
+        problem.build_model_presolved()
+
+
+def run_shard(folder_path, scenarios, case=None, shard=0, build_method="build_model_matrix", solver="gurobi",
+              solver_params=None, sparse_capacity=True, warm_start=True, output_dir=None, trace_path=None):
+    from np_gurobipy_obj import NP_problem
+    from instrumentation import Instrumentation
+
+    case = case or os.path.basename(os.path.normpath(folder_path))
+    if solver_params is None:
+        solver_params = dict(MIPGap=0.00)
+    instrumentation = Instrumentation(case, verbose=False, jsonl_path=trace_path)
+    start_time = time.time()
+    problem = NP_problem(case, folder_path, instrumentation=instrumentation)
+    problem.solver = solver
+    problem.sparse_capacity = sparse_capacity
+    getattr(problem, build_method)()
+    problem.solver_params = solver_params
+    print("Shard {}: read and build {:.2f} s, {} scenarios".format(shard, time.time() - start_time, len(scenarios)))
+
+    base_costs = dict(problem.costs)
+    base_demand = dict(problem.demand)
+    # MIP starts are only set on the Gurobi variables of the full model
+    can_warm_start = warm_start and solver == "gurobi" and build_method != "build_model_presolved"
+    previous = None
+    rows = list()
+    for s in scenarios:
+        start_time = time.time()
+        row = dict(case=case, scenario=s["name"], shard=shard, status="ok", demand_multiplier=s["demand_multiplier"],
+                   **dict(base_costs, **s["costs"]))
+        try:
+            with instrumentation.span("scenario", scenario=s["name"]):
+                apply_scenario(problem, s, base_costs, base_demand)
+                row["warm_start"] = can_warm_start and previous is not None
+                if row["warm_start"]:
+                    problem.set_mip_start(previous)
+                row["update_time"] = time.time() - start_time
+                problem.solve_model()
+                if not problem.has_solution():
+                    row.update(status="no solution")
+                    continue
+                problem.get_df_performance_data()
+                problem.gen_solution()
+            row.update(problem.performance_data)
+            row.update({k: len(problem.solution[k]) for k in ["new_sites", "new_nodes", "new_cells", "upgraded_cells"]})
+            previous = dict(problem.solution)
+            if output_dir is not None:
+                problem.save_solution(os.path.join(output_dir, "{}_{}.npz".format(case, s["name"])))
+        except Exception as e:
+            row.update(status="error", error="{}: {}".format(type(e).__name__, e))
+            traceback.print_exc()
+        finally:
+            row["wall_time"] = time.time() - start_time
+            rows.append(row)
+    instrumentation.write_jsonl()
+    return rows
+
+
+def run_scenarios(folder_path, scenarios, results_path=None, case=None, workers=1, total_threads=None,
+                  build_method="build_model_matrix", solver="gurobi", solver_params=None, sparse_capacity=True,
+                  warm_start=True, output_dir=None, trace_path=None):
+    # Each worker reads and builds the case once and runs a shard of the scenarios on it
+    if solver_params is None:
+        solver_params = dict(MIPGap=0.00)
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+    workers = max(1, min(workers, len(scenarios)))
+    shards = shard_scenarios(scenarios, workers)
+    if workers == 1:
+        rows = run_shard(folder_path, scenarios, case, 0, build_method, solver, solver_params, sparse_capacity,
+                         warm_start, output_dir, trace_path)
+    else:
+        # Split the available cores across workers, as in batch_runner
+        threads = max(1, (total_threads or os.cpu_count()) // workers)
+        solver_params = dict(solver_params, Threads=threads)
+        print("Running {} shards with {} threads each".format(workers, threads))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(run_shard, folder_path, shard, case, k, build_method, solver, solver_params,
+                                       sparse_capacity, warm_start, output_dir, trace_path)
+                       for k, shard in enumerate(shards)]
+            rows = [row for future in futures for row in future.result()]
+
+    df = pd.DataFrame(rows)
+    columns = ["scenario", "demand_multiplier"] + [c for c in ["status", "obj_func", "gap", "run_time", "update_time",
+                                                                "warm_start", "new_sites", "new_nodes", "new_cells",
+                                                                "upgraded_cells"] if c in df.columns]
+    print()
+    print(df[columns].to_string(index=False))
+    if results_path is not None:
+        df.to_csv(results_path, index=False)
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Solve cost and demand scenarios of a case on a single built model")
+    parser.add_argument("folder")
+    parser.add_argument("--scenarios", default=None, help="scenario CSV, see read_scenarios")
+    parser.add_argument("--demand-multipliers", type=float, nargs="+", default=[1.0],
+                        help="scenario grid, used when --scenarios is not given")
+    parser.add_argument("--cost-multipliers", type=float, nargs="+", default=[1.0])
+    parser.add_argument("--cost-parameters", nargs="+", default=None, choices=list(COSTS),
+                        help="cost parameters the cost multipliers apply to (all by default)")
+    parser.add_argument("--results", default="scenario_results.csv")
+    parser.add_argument("--output-dir", default=None, help="directory for the npz solution of every scenario")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--threads", type=int, default=None, help="total solver threads to split across workers")
+    parser.add_argument("--build-method", default="build_model_matrix",
+                        choices=["build_model", "build_model_matrix", "build_model_presolved"])
+    parser.add_argument("--solver", default="gurobi", choices=["gurobi", "highs"])
+    parser.add_argument("--time-limit", type=float, default=6000)
+    parser.add_argument("--mip-gap", type=float, default=0.00)
+    parser.add_argument("--no-warm-start", action="store_true")
+    parser.add_argument("--trace-file", default=None, help="JSONL file the instrumentation records are appended to")
+    args = parser.parse_args()
+    if args.solver != "gurobi" and args.build_method == "build_model":
+        parser.error("--build-method build_model only supports --solver gurobi")
+
+    if args.scenarios is not None:
+        scenarios = read_scenarios(args.scenarios)
+    else:
+        scenarios = scenario_grid(args.demand_multipliers, args.cost_multipliers, args.cost_parameters)
+    run_scenarios(args.folder, scenarios, args.results, workers=args.workers, total_threads=args.threads,
+                  build_method=args.build_method, solver=args.solver,
+                  solver_params=dict(TimeLimit=args.time_limit, MIPGap=args.mip_gap),
+                  sparse_capacity=True, warm_start=not args.no_warm_start, output_dir=args.output_dir,
+                  trace_path=args.trace_file)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import numpy as np
+
+from np_instance import CodedKeys, key_codes
+
+MAX_REPORTED = 20
+
+CHECK_MESSAGES = dict(
+    DemandFullfilment=("Demand not met", ["lot", "node"]),
+    MaxTrafficOfCell=("Capacity violated", ["site", "node", "cell"]),
+    EnoughCapacityPerLot=("Not enough capacity for lot", ["lot", "node"]),
+    EnoughGlobalCapacity=("Not enough global capacity", ["node"]),
+    MinCellCapacity=("Capacity below initial capacity", ["site", "node", "cell"]),
+    MaxCellCapacityExistingCells=("Capacity above limit of existing cell", ["site", "node", "cell"]),
+    MaxCellCapacityNewCells=("Capacity above limit of new cell", ["site", "node", "cell"]),
+    NewCellIfNodeExists=("New cell without new node", ["site", "node", "cell"]),
+    NewNodeIfSiteExists=("New node without new site", ["site", "node"]),
+    AllOrNoneNewCell=("Only part of the new cells installed", ["site", "node"]),
+    AllOrNoneUpgradeCell=("Only part of the cells upgraded", ["site", "node"]),
+    NonNegativeTraffic=("Negative traffic", ["site", "node", "cell", "lot"]),
+)
+
+
+def _violated(lhs, rhs, sense, tol):
+    lhs = np.asarray(lhs, dtype=float)
+    rhs = np.asarray(rhs, dtype=float)
+    scale = tol * np.maximum(1, np.abs(rhs))
+    if sense == "<=":
+        return lhs - rhs > scale
+    if sense == ">=":
+        return rhs - lhs > scale
+    return np.abs(lhs - rhs) > scale
+
+
+def _partial_groups(selected_pairs, group_pairs, n_pairs):
+    # Site-node pairs with some but not all of their cells selected
+    counts = np.bincount(selected_pairs, minlength=n_pairs)
+    return np.flatnonzero((counts > 0) & (counts != np.bincount(group_pairs, minlength=n_pairs)))
+
+
+def check_solution(problem, solution, tol=1e-6):
+    # Checks every constraint of the NP_problem formulation on a solution dict and returns a
+    # dict constraint name -> list of violated keys. Works on the code arrays of the instance, only the
+    # violated keys are decoded
+    report = dict()
+    d = problem.model_instance()
+    sites, nodes, cells, lots = d.site_ids, d.node_ids, d.cell_ids, d.lot_ids
+    n_pairs = d.n_sites * d.n_nodes
+    n_cells = n_pairs * d.n_cells
+    n_lot_nodes = d.n_lots * d.n_nodes
+    pair_keys = lambda pairs: CodedKeys([sites, nodes], list(np.divmod(pairs, d.n_nodes)))
+
+    traffic_keys = list(solution["traffic_of_cell"].keys())
+    t_site, t_node, t_cell, t_lot = key_codes(traffic_keys, [sites, nodes, cells, lots],
+                                              ["site", "node", "cell", "lot"])
+    traffic = np.fromiter(solution["traffic_of_cell"].values(), dtype=float, count=len(traffic_keys))
+    t_cells = d.cell_code(t_site, t_node, t_cell)
+    capacity = np.bincount(d.cell_code(*key_codes(solution["final_capacity"].keys(), [sites, nodes, cells],
+                                                  ["site", "node", "cell"])),
+                           np.fromiter(solution["final_capacity"].values(), dtype=float,
+                                       count=len(solution["final_capacity"])), n_cells)
+    demand_lot_nodes = d.lot_node_code(d.demand_lot, d.demand_node)
+    demand_keys = CodedKeys([lots, nodes], [d.demand_lot, d.demand_node])
+
+    report["NonNegativeTraffic"] = [traffic_keys[i] for i in np.flatnonzero(traffic < -tol)]
+
+    # Demand is met
+    served = np.bincount(d.lot_node_code(t_lot, t_node), traffic, n_lot_nodes)
+    report["DemandFullfilment"] = demand_keys.select(_violated(served[demand_lot_nodes], d.demand, "==", tol))
+
+    # Capacity not violated
+    used_cells = np.unique(t_cells)
+    used = np.bincount(t_cells, traffic, n_cells)[used_cells]
+    violated = used_cells[_violated(used, capacity[used_cells], "<=", tol)]
+    report["MaxTrafficOfCell"] = d.cell_keys(*d.cell_columns(violated)).select()
+
+    # Enough capacity per lot, over the cells covering each lot
+    lot_capacity = np.bincount(d.lot_node_code(d.cov_lot, d.cov_node),
+                               capacity[d.cell_code(d.cov_site, d.cov_node, d.cov_cell)], n_lot_nodes)
+    report["EnoughCapacityPerLot"] = demand_keys.select(_violated(lot_capacity[demand_lot_nodes], d.demand, ">=",
+                                                                  tol))
+
+    # Enough global capacity
+    demand_nodes = np.unique(d.demand_node)
+    node_demand = np.bincount(d.demand_node, d.demand, d.n_nodes)[demand_nodes]
+    if problem.sparse_capacity and not problem.legacy_global_capacity:
+        node_capacity = capacity.reshape(d.n_sites, d.n_nodes, d.n_cells).sum(axis=(0, 2))[demand_nodes]
+    else:
+        node_capacity = np.full(len(demand_nodes), capacity.sum())
+    report["EnoughGlobalCapacity"] = nodes[demand_nodes[_violated(node_capacity, node_demand, ">=", tol)]].tolist()
+
+    # Min and max capacity of existing cells, and max capacity of new cells
+    cap_cells = d.cell_code(d.cap_site, d.cap_node, d.cap_cell)
+    cap_pairs = d.cap_site.astype(np.int64) * d.n_nodes + d.cap_node
+    final = capacity[cap_cells]
+    existing = d.cap_is_existing
+    potential = ~existing
+    upgraded = np.isin(cap_cells, d.cell_code(*key_codes(solution["upgraded_cells"], [sites, nodes, cells],
+                                                         ["site", "node", "cell"])))
+    installed = np.isin(cap_cells, d.cell_code(*key_codes(solution["new_cells"], [sites, nodes, cells],
+                                                          ["site", "node", "cell"])))
+    cap_keys = d.cell_keys(d.cap_site, d.cap_node, d.cap_cell)
+    report["MinCellCapacity"] = cap_keys.select(existing & _violated(final, d.initial_capacity, ">=", tol))
+    report["MaxCellCapacityExistingCells"] = cap_keys.select(
+        existing & _violated(final, np.where(upgraded, d.max_capacity, d.initial_capacity), "<=", tol))
+    report["MaxCellCapacityNewCells"] = cap_keys.select(
+        potential & _violated(final, np.where(installed, d.max_capacity, 0), "<=", tol))
+
+    # Hierarchy site -> node -> cell. A node is potential unless an existing cell is installed on it
+    existing_pairs = np.zeros(n_pairs, dtype=bool)
+    existing_pairs[cap_pairs[existing]] = True
+    new_cell_site, new_cell_node, new_cell_cell = key_codes(solution["new_cells"], [sites, nodes, cells],
+                                                            ["site", "node", "cell"])
+    new_node_site, new_node_node = key_codes(solution["new_nodes"], [sites, nodes], ["site", "node"])
+    new_cell_pairs = new_cell_site.astype(np.int64) * d.n_nodes + new_cell_node
+    new_node_pairs = new_node_site.astype(np.int64) * d.n_nodes + new_node_node
+    orphan_cells = ~existing_pairs[new_cell_pairs] & ~np.isin(new_cell_pairs, new_node_pairs)
+    report["NewCellIfNodeExists"] = d.cell_keys(new_cell_site, new_cell_node, new_cell_cell).select(orphan_cells)
+    orphan_nodes = (new_node_site >= d.n_existing_sites) & \
+        ~np.isin(new_node_site, key_codes(solution["new_sites"], [sites], ["site"])[0])
+    report["NewNodeIfSiteExists"] = pair_keys(new_node_pairs).select(orphan_nodes)
+
+    # All or none
+    upgraded_site, upgraded_node, _ = key_codes(solution["upgraded_cells"], [sites, nodes, cells],
+                                                ["site", "node", "cell"])
+    report["AllOrNoneNewCell"] = pair_keys(_partial_groups(new_cell_pairs, cap_pairs[potential], n_pairs)).select()
+    report["AllOrNoneUpgradeCell"] = pair_keys(_partial_groups(
+        upgraded_site.astype(np.int64) * d.n_nodes + upgraded_node, cap_pairs[existing], n_pairs)).select()
+
+    return report
+
+
+def report_to_text(report):
+    text = ""
+    for name, violations in report.items():
+        message, columns = CHECK_MESSAGES[name]
+        if len(violations) == 0:
+            text += "OK. {} constraint met\n".format(name)
+            continue
+        for key in violations[:MAX_REPORTED]:
+            key = key if isinstance(key, tuple) else (key,)
+            text += "ERROR. {}. {}\n".format(message, ", ".join("{} {}".format(col.capitalize(), k)
+                                                                 for col, k in zip(columns, key)))
+        if len(violations) > MAX_REPORTED:
+            text += "ERROR. {}. ... and {} more\n".format(message, len(violations) - MAX_REPORTED)
+    return text
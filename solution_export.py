@@ -0,0 +1,137 @@
+import os
+from itertools import compress, islice
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from np_instance import CodedKeys
+
+# Solution category -> (variable, key columns). Decisions are stored as selected keys, traffic and
+# capacity as non-zero values
+CATEGORIES = dict(
+    new_sites=("v01NewSite", ["site"]),
+    new_nodes=("v01NewNode", ["site", "node"]),
+    new_cells=("v01NewCell", ["site", "node", "cell"]),
+    upgraded_cells=("v01UpgradeCell", ["site", "node", "cell"]),
+    final_capacity=("vFinalCapacity", ["site", "node", "cell"]),
+    traffic_of_cell=("vTrafficOfCell", ["site", "node", "cell", "lot"]),
+)
+VALUE_CATEGORIES = ["final_capacity", "traffic_of_cell"]
+FORMATS = ["parquet", "csv"]
+CHUNK_ROWS = 1000000
+
+
+def _as_tuples(keys, n_columns):
+    return keys if n_columns > 1 else ((k,) for k in keys)
+
+
+def solution_arrays(problem, category, tol=1e-9):
+    # Selected (non-zero) keys and values of a category, from the solver values when they exist, so
+    # that the full traffic dict is never needed, or from the solution dict (e.g. heuristic solutions)
+    name, columns = CATEGORIES[category]
+    values = getattr(problem, "solution_values", dict()).get(name)
+    if values is not None:
+        keys = problem.var_keys(name)
+        threshold = 0.5 if category not in VALUE_CATEGORIES else tol
+        mask = np.abs(values) > threshold
+        if isinstance(keys, CodedKeys):
+            # Only the selected keys are decoded
+            return iter(_as_tuples(keys.select(mask), len(columns))), values[mask]
+        return compress(_as_tuples(keys, len(columns)), mask), values[mask]
+    selected = problem.solution[category]
+    if category in VALUE_CATEGORIES:
+        values = np.fromiter(selected.values(), dtype=float, count=len(selected))
+        mask = np.abs(values) > tol
+        return compress(selected.keys(), mask), values[mask]
+    return _as_tuples(selected, len(columns)), np.ones(len(selected))
+
+
+def _chunks(keys, values, chunk_rows):
+    start = 0
+    while True:
+        chunk = list(islice(keys, chunk_rows))
+        if len(chunk) == 0 and start > 0:
+            return
+        yield chunk, values[start:start + len(chunk)]
+        start += len(chunk)
+        if len(chunk) < chunk_rows:
+            return
+
+
+def write_category(path, keys, values, columns, file_format, with_values, chunk_rows=CHUNK_ROWS):
+    # Streams the rows in chunks of chunk_rows, so only one chunk is held as a DataFrame
+    writer = None
+    for k, (chunk, chunk_values) in enumerate(_chunks(keys, values, chunk_rows)):
+        df = pd.DataFrame.from_records(chunk, columns=columns)
+        if with_values:
+            df["value"] = chunk_values
+        if file_format == "csv":
+            df.to_csv(path, mode="w" if k == 0 else "a", header=k == 0, index=False)
+            continue
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if writer is None:
+            writer = pq.ParquetWriter(path, table.schema)
+        writer.write_table(table.cast(writer.schema))
+    if writer is not None:
+        writer.close()
+
+
+def export_solution(problem, output_dir=".", formats=("parquet",), chunk_rows=CHUNK_ROWS):
+    for file_format in formats:
+        if file_format not in FORMATS:
+            raise ValueError("Unknown export format {}. Available: {}".format(file_format, FORMATS))
+    os.makedirs(output_dir, exist_ok=True)
+    paths = list()
+    for file_format in formats:
+        for category, (name, columns) in CATEGORIES.items():
+            keys, values = solution_arrays(problem, category)
+            path = os.path.join(output_dir, "{}_{}.{}".format(problem.name, category, file_format))
+            write_category(path, keys, values, columns, file_format, category in VALUE_CATEGORIES, chunk_rows)
+            paths.append(path)
+        path = os.path.join(output_dir, "{}_general.{}".format(problem.name, file_format))
+        df = pd.DataFrame(getattr(problem, "performance_data", dict(case=problem.name)), index=[0])
+        if file_format == "csv":
+            df.to_csv(path, index=False)
+        else:
+            df.to_parquet(path, index=False)
+        paths.append(path)
+    return paths
+
+
+def _id_array(ids):
+    # Ids keep their type (int or str) so loaded keys match the model keys
+    return np.array(list(ids))
+
+
+def save_solution(path, problem):
+    # Compact binary solution: per category and key column, int32 codes into an array of ids, plus
+    # float64 values for capacity and traffic. Loads without pickle
+    arrays = dict()
+    for category, (name, columns) in CATEGORIES.items():
+        keys, values = solution_arrays(problem, category)
+        keys = list(keys)
+        key_columns = list(zip(*keys)) if len(keys) > 0 else [[] for _ in columns]
+        for column, column_values in zip(columns, key_columns):
+            codes, ids = pd.factorize(pd.Series(column_values, dtype=object))
+            arrays["{}.{}".format(category, column)] = codes.astype(np.int32)
+            arrays["{}.{}.ids".format(category, column)] = _id_array(ids)
+        if category in VALUE_CATEGORIES:
+            arrays["{}.value".format(category)] = np.asarray(values, dtype=np.float64)
+    np.savez(path, **arrays)
+
+
+def load_solution(path):
+    # Returns a solution dict like NP_problem.gen_solution, with zero traffic and capacity left out
+    solution = dict()
+    with np.load(path, allow_pickle=False) as data:
+        for category, (name, columns) in CATEGORIES.items():
+            key_columns = [data["{}.{}.ids".format(category, c)][data["{}.{}".format(category, c)]].tolist()
+                           for c in columns]
+            keys = key_columns[0] if len(columns) == 1 else list(zip(*key_columns))
+            if category in VALUE_CATEGORIES:
+                solution[category] = dict(zip(keys, data["{}.value".format(category)].tolist()))
+            else:
+                solution[category] = keys
+    return solution
@@ -0,0 +1,196 @@
+import numpy as np
+import scipy.sparse as sp
+
+from matrix_model import BINARY, LESS_EQUAL, GREATER_EQUAL
+
+# Gurobi parameter names used by NP_problem.solver_params and their HiGHS equivalents
+HIGHS_PARAMS = dict(
+    TimeLimit="time_limit",
+    MIPGap="mip_rel_gap",
+    MIPGapAbs="mip_abs_gap",
+    Threads="threads",
+    OutputFlag="output_flag",
+    Seed="random_seed",
+    Presolve="presolve",
+)
+# Gurobi ignores case and underscores in parameter names, so TIME_LIMIT is TimeLimit
+HIGHS_PARAM_NAMES = {k.lower(): v for k, v in HIGHS_PARAMS.items()}
+
+
+class LazyDicts(dict):
+    # Key maps of the model blocks, built by build(name) the first time they are looked up
+    def __init__(self, build):
+        super().__init__()
+        self.build = build
+
+    def __missing__(self, name):
+        self[name] = self.build(name)
+        return self[name]
+
+
+class GurobiBackend:
+    name = "gurobi"
+
+    def __init__(self, model_name="network_dimensioning"):
+        import gurobipy as gp
+        from gurobipy import GRB
+
+        self.gp = gp
+        self.model = gp.Model(model_name)
+        self.model.ModelSense = GRB.MINIMIZE
+        self.keys = dict()
+        self.mvars = dict()
+        self.family_keys = dict()
+        self.mconstrs = dict()
+        self.vars = LazyDicts(lambda name: self.gp.tupledict(zip(self.keys[name], self.mvars[name].tolist())))
+        self.constrs = LazyDicts(lambda name: self.gp.tupledict(zip(self.family_keys[name],
+                                                                    self.mconstrs[name].tolist())))
+
+    def add_variables(self, var_blocks):
+        for name, keys, vtype, obj in var_blocks:
+            self.keys[name] = keys
+            self.mvars[name] = self.model.addMVar(len(keys), vtype=vtype, lb=0, obj=obj, name=name)
+
+    def set_objective_offset(self, offset):
+        self.model.ObjCon = offset
+
+    def set_costs(self, name, obj):
+        n = len(self.keys[name])
+        self.model.setAttr("Obj", self.mvars[name].tolist(), np.broadcast_to(obj, n).tolist())
+
+    def add_family(self, f):
+        expr = sum(A @ self.mvars[var_block] for var_block, A in f.blocks.items())
+        if f.sense == LESS_EQUAL:
+            mconstr = self.model.addConstr(expr <= f.rhs, name=f.name)
+        elif f.sense == GREATER_EQUAL:
+            mconstr = self.model.addConstr(expr >= f.rhs, name=f.name)
+        else:
+            mconstr = self.model.addConstr(expr == f.rhs, name=f.name)
+        if f.keys is not None:
+            self.family_keys[f.name] = f.keys
+            self.mconstrs[f.name] = mconstr
+
+    def set_rhs(self, family, keys, rhs):
+        self.model.setAttr("RHS", [self.constrs[family][k] for k in keys], list(rhs))
+
+    def set_params(self, params):
+        for param in params.keys():
+            self.model.setParam(param, params[param])
+
+    def solve(self, callback=None):
+        self.model.optimize(callback)
+
+    def has_solution(self):
+        return self.model.SolCount > 0
+
+    def values(self, name):
+        return np.asarray(self.mvars[name].X, dtype=float)
+
+    def performance_data(self):
+        return dict(obj_func=self.model.ObjVal, gap=self.model.MIPGap, run_time=self.model.Runtime)
+
+
+class HighsBackend:
+    name = "highs"
+
+    def __init__(self, model_name="network_dimensioning"):
+        import highspy
+
+        self.highspy = highspy
+        self.model = highspy.Highs()
+        self.keys = dict()
+        self.offsets = dict()
+        self.families = dict()
+        self.rows = LazyDicts(lambda name: {k: self.families[name][1] + i
+                                            for i, k in enumerate(self.families[name][2])})
+        self.n_cols = 0
+        self.n_rows = 0
+        self.col_value = None
+
+    def add_variables(self, var_blocks):
+        for name, keys, vtype, obj in var_blocks:
+            n = len(keys)
+            self.keys[name] = keys
+            self.offsets[name] = self.n_cols
+            upper = np.ones(n) if vtype == BINARY else np.full(n, self.highspy.kHighsInf)
+            self.model.addCols(n, np.full(n, obj, dtype=np.float64), np.zeros(n), upper, 0,
+                               np.zeros(n, dtype=np.int32), np.zeros(0, dtype=np.int32), np.zeros(0))
+            if vtype == BINARY and n > 0:
+                self.model.changeColsIntegrality(n, np.arange(self.n_cols, self.n_cols + n, dtype=np.int32),
+                                                 np.full(n, self.highspy.HighsVarType.kInteger))
+            self.n_cols += n
+
+    def set_objective_offset(self, offset):
+        self.model.changeObjectiveOffset(offset)
+
+    def set_costs(self, name, obj):
+        n = len(self.keys[name])
+        if n > 0:
+            self.model.changeColsCost(n, np.arange(self.offsets[name], self.offsets[name] + n, dtype=np.int32),
+                                      np.broadcast_to(obj, n).astype(np.float64))
+
+    def add_family(self, f):
+        A = sp.csr_matrix((f.num_rows, self.n_cols))
+        for var_block, block in f.blocks.items():
+            block = block.tocoo()
+            A = A + sp.csr_matrix((block.data, (block.row, block.col + self.offsets[var_block])),
+                                  shape=(f.num_rows, self.n_cols))
+        A = A.tocsr()
+        lower = np.full(f.num_rows, -self.highspy.kHighsInf) if f.sense == LESS_EQUAL else f.rhs
+        upper = np.full(f.num_rows, self.highspy.kHighsInf) if f.sense == GREATER_EQUAL else f.rhs
+        self.model.addRows(f.num_rows, lower, upper, A.nnz, A.indptr[:-1].astype(np.int32),
+                           A.indices.astype(np.int32), A.data.astype(np.float64))
+        if f.keys is not None:
+            self.families[f.name] = (f.sense, self.n_rows, f.keys)
+        self.n_rows += f.num_rows
+
+    def set_rhs(self, family, keys, rhs):
+        sense = self.families[family][0]
+        rows = self.rows[family]
+        rhs = np.asarray(rhs, dtype=np.float64)
+        infinite = np.full(len(rhs), self.highspy.kHighsInf)
+        lower = -infinite if sense == LESS_EQUAL else rhs
+        upper = infinite if sense == GREATER_EQUAL else rhs
+        if len(rhs) > 0:
+            self.model.changeRowsBounds(len(rhs), np.array([rows[k] for k in keys], dtype=np.int32), lower, upper)
+
+    def set_params(self, params):
+        for param in params.keys():
+            name = HIGHS_PARAM_NAMES.get(param.replace("_", "").lower())
+            if name is None:
+                raise ValueError("Parameter {} has no HiGHS equivalent. Supported: {}".format(param, list(HIGHS_PARAMS)))
+            value = params[param]
+            if name == "output_flag":
+                value = bool(value)
+            elif name == "presolve":
+                value = "off" if value == 0 else "on"
+            elif isinstance(value, float) and value.is_integer() and name in ("threads", "random_seed"):
+                value = int(value)
+            if self.model.setOptionValue(name, value) != self.highspy.HighsStatus.kOk:
+                raise ValueError("HiGHS rejected {}={} for parameter {}".format(name, value, param))
+
+    def solve(self, callback=None):
+        if callback is not None:
+            raise ValueError("Callbacks are only supported by the Gurobi backend")
+        self.model.run()
+        self.col_value = np.asarray(self.model.getSolution().col_value, dtype=float)
+
+    def has_solution(self):
+        return self.model.getInfo().primal_solution_status == 2
+
+    def values(self, name):
+        start = self.offsets[name]
+        return self.col_value[start:start + len(self.keys[name])]
+
+    def performance_data(self):
+        info = self.model.getInfo()
+        return dict(obj_func=info.objective_function_value, gap=info.mip_gap, run_time=self.model.getRunTime())
+
+
+BACKENDS = dict(gurobi=GurobiBackend, highs=HighsBackend)
+
+
+def make_backend(solver, model_name="network_dimensioning"):
+    if solver not in BACKENDS:
+        raise ValueError("Unknown solver backend {}. Available: {}".format(solver, list(BACKENDS)))
+    return BACKENDS[solver](model_name)
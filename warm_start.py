@@ -0,0 +1,69 @@
+import sys
+import time
+
+import pandas as pd
+from gurobipy import GRB
+
+from np_gurobipy_obj import NP_problem
+from read_data import read_demand
+
+
+def first_feasible_callback(model, where):
+    if where == GRB.Callback.MIPSOL and model._first_feasible is None:
+        model._first_feasible = model.cbGet(GRB.Callback.RUNTIME)
+
+
+def timed_solve(instance):
+    instance.model._first_feasible = None
+    instance.solve_model(first_feasible_callback)
+    first_feasible = instance.model._first_feasible
+    if first_feasible is None and instance.model.SolCount > 0:
+        first_feasible = instance.model.Runtime
+    return dict(time_to_first_feasible=first_feasible,
+                run_time=instance.model.Runtime,
+                obj_func=instance.model.ObjVal if instance.model.SolCount > 0 else None)
+
+
+def compare_warm_cold(case, folder_path, new_folder_path, solution_path=None, solver_params=None,
+                      build_method="build_model_matrix"):
+    # folder_path holds the case solved previously and new_folder_path the same case with an
+    # updated traffic_demand.csv
+    if solver_params is None:
+        solver_params = dict(MIPGap=0.00)
+    rows = list()
+
+    # Cold: read, build and solve the updated case from scratch
+    start_time = time.time()
+    cold = NP_problem(case, new_folder_path)
+    getattr(cold, build_method)()
+    cold.solver_params = solver_params
+    row = dict(mode="cold", prepare_time=time.time() - start_time)
+    row.update(timed_solve(cold))
+    rows.append(row)
+
+    # Warm: previous model, only the demand-dependent RHS are updated and the previous solution is the MIP start
+    warm = NP_problem(case, folder_path)
+    getattr(warm, build_method)()
+    warm.solver_params = solver_params
+    if solution_path is None:
+        warm.solve_model()
+        warm.gen_solution()
+    start_time = time.time()
+    changed = warm.update_demand(read_demand(new_folder_path))
+    if solution_path is None:
+        warm.set_mip_start(warm.solution)
+    else:
+        warm.load_mip_start(solution_path)
+    row = dict(mode="warm", prepare_time=time.time() - start_time)
+    row.update(timed_solve(warm))
+    rows.append(row)
+
+    df = pd.DataFrame(rows).set_index("mode")
+    print()
+    print("Lot-node pairs with changed demand: {}".format(len(changed)))
+    print(df)
+    return df
+
+
+if __name__ == "__main__":
+    compare_warm_cold(sys.argv[1], sys.argv[1], sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else None)